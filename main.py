@@ -18,17 +18,23 @@ Date: 2024-06-24
 # ============================================================
 
 #Import packages
-import trimesh
-import matplotlib.pyplot as plt
+import os
+
+import numpy as np
 
 #Import modules
-from scripts.visualization import ObjectPlotter, create_plane_mesh, ContourPlotter
 from scripts.centerline_points import centerline_straightcylinder, centerline_case_3
-from scripts.plane_intersections import intersection_planes_with_objects
+from scripts.centerline import Centerline
+from scripts.mesh_store import load_mesh
+from scripts.plane_intersections import intersection_planes_with_objects, contact_candidate_planes
+from scripts.spatial_index import build_face_indices
 from scripts.contour_creation import create_contour_from_intersection_points
-from scripts.line_intersections import filter_planes, line_intersections
+from scripts.line_intersections import filter_planes, create_lines, line_hit_distances
 from scripts.distances import calculate_distance, filter_distances
 from scripts.features import feature_maximum_contact_length, feature_angles
+from scripts.parallel import PlaneExecutor
+from scripts.cache import SliceCache, cached_planes
+from scripts import profiling
 
 
 def main():
@@ -37,224 +43,296 @@ def main():
     # ============================================================
     
     number_of_slices = 20 #Defines the resolution
-    per_degree = 1 #Degree of line segments
+    per_degree = 1 #Degree of line segments, may be a float that divides 360 such as 0.25
+    angular_resolution = None #Optionally provide a finer resolution in degrees (e.g. 0.1), only lines near a contact transition are refined
     minimum_degrees = 40 #Provide a treshold of the minimum value of degrees between the vessel and the tumor that you are interested in
     example_plane = 10 #Provide as integer
     vessel_wall = 1.5 #Provide the largest wall thickness in mm of the CA, SMA, CHA, SM or PV
+    workers = 1 #Number of processes for the per-plane calculations, 1 runs everything in this process
+    chunk_size = 8 #Number of planes per parallel task
+    cache_directory = None #Optionally provide a directory (e.g. '.slice_cache') to reuse the slicing and contours of earlier runs
+    profile = False #Print the time, CPU time and counters (planes, faces, segments, rays and hits) per stage at the end
+    visualize = True #Create the figures, with False nothing is plotted and matplotlib is not imported
+    figure_directory = None #Optionally provide a directory to write the figures to files without opening windows (headless)
+    figure_format = "png" #Format of the written figures, png or svg
+    preview_faces = 20000 #Meshes with more faces are decimated in the 3D figures
+    
+    if profile:
+        profiling.reset()
+        profiling.enable()
     
-    #!Note that the centerline and normals are needed for calculations as well, 
-    #but this is integrated for the three mock-cases in this code
+    figures = {} #Figures by name, shown or written at the end
+
+    #Print the report and stop profiling also when there is no contact or an error
+    try:
+        if visualize:
+            #Import the visualization only when figures are created, written figures are rendered off-screen
+            from scripts import visualization
+            if figure_directory is not None:
+                os.makedirs(figure_directory, exist_ok=True)
+                visualization.use_off_screen()
     
-    # ======================================================================================
-    # Load data and compute centerline points and corresponding normals: MOCK CASE SPECIFIC
-    # ======================================================================================
-
-    #Load data and add to the dictionary object_meshes
-    #Make sure you always name the tumor "tumor..."
-    #Make sure you give the vessels the name of the corresponding vessel
-    #DO NOT inmport any other structures then the vessels and the tumor
+        #!Note that the centerline and normals are needed for calculations as well, 
+        #but this is integrated for the three mock-cases in this code
     
-    mock_case = 3 #Pick which mock case you want to run (case 1, 2 and three)
-    #Case 1: Low resolution, straight cylinder
-    #Case 2: high resolution, straight cylinder, rounded tumor, slightly less angle then 180 degrees
-    #Case 3: low resolution, curved cylinder
-
-    if mock_case == 1:
-        #Load data
-        tumor = trimesh.load('models/case1_tumor.STL')
-        vessel = trimesh.load('models/case1_SMA.STL')
-        object_meshes = {"tumor":tumor, "SMA":vessel} #Always add the tumor first and then the vessel
-        
-        #Compute the centerline of the straight cylinder
-        centerline_points, normal_points = centerline_straightcylinder(number_of_slices)
-
-        #Visualize object_meshes in a 3D visualization plot to get insight into the patient case
-        object_plotter = ObjectPlotter()
-        object_plotter.add_object(vessel, label=f'{list(object_meshes.keys())[1]}', color="r", alpha=0.2)
-        object_plotter.add_object(tumor, label="tumor", color="y", alpha=0.2)
-        object_plotter.add_points(centerline_points, color="black")
+        # ======================================================================================
+        # Load data and compute centerline points and corresponding normals: MOCK CASE SPECIFIC
+        # ======================================================================================
+
+        #Load data and add to the dictionary object_meshes
+        #Make sure you always name the tumor "tumor..."
+        #Make sure you give the vessels the name of the corresponding vessel
+        #DO NOT inmport any other structures then the vessels and the tumor
+        #This script assesses one vessel, for multiple vessels each with their own centerline use scripts/multi_vessel.py
+        #or the batch runner
+    
+        mock_case = 3 #Pick which mock case you want to run (case 1, 2 and three)
+        #Case 1: Low resolution, straight cylinder
+        #Case 2: high resolution, straight cylinder, rounded tumor, slightly less angle then 180 degrees
+        #Case 3: low resolution, curved cylinder
+
+        if mock_case == 1:
+            #Load data
+            tumor = load_mesh('models/case1_tumor.STL')
+            vessel = load_mesh('models/case1_SMA.STL')
+            object_meshes = {"tumor":tumor, "SMA":vessel} #Always add the tumor first and then the vessel
         
-    elif mock_case == 2: 
-        #Load data
-        tumor = trimesh.load('models/case2_tumor.STL')
-        vessel = trimesh.load('models/case2_SMA.STL')
-        object_meshes = {"tumor":tumor, "SMA":vessel}
+            #Compute the centerline of the straight cylinder
+            centerline_points, normal_points = centerline_straightcylinder(number_of_slices)
         
-        #Compute the centerline of the straight cylinder
-        centerline_points, normal_points = centerline_straightcylinder(number_of_slices)
+        elif mock_case == 2: 
+            #Load data
+            tumor = load_mesh('models/case2_tumor.STL')
+            vessel = load_mesh('models/case2_SMA.STL')
+            object_meshes = {"tumor":tumor, "SMA":vessel}
         
-        #Visualize object_meshes in a 3D visualization plot to get insight into the patient case
-        object_plotter = ObjectPlotter()
-        object_plotter.add_object(vessel, label=f'{list(object_meshes.keys())[1]}', color="r", alpha=0.2)
-        object_plotter.add_object(tumor, label="tumor", color="y", alpha=0.2)
-        object_plotter.add_points(centerline_points, color="black")
+            #Compute the centerline of the straight cylinder
+            centerline_points, normal_points = centerline_straightcylinder(number_of_slices)
         
-    else:
-        tumor = trimesh.load('models/case3_tumor.STL')
-        vessel = trimesh.load('models/case3_SMA.STL')
-        object_meshes = {"tumor":tumor, "SMA":vessel}
+        else:
+            tumor = load_mesh('models/case3_tumor.STL')
+            vessel = load_mesh('models/case3_SMA.STL')
+            object_meshes = {"tumor":tumor, "SMA":vessel}
         
-        #Compute the centerline of the curved cylinder
-        centerline_points, normal_points, arc_length = centerline_case_3(number_of_slices)
-        slice_thickness = arc_length / number_of_slices
+            #Compute the centerline of the curved cylinder
+            centerline_points, normal_points, arc_length = centerline_case_3(number_of_slices)
+            slice_thickness = arc_length / number_of_slices
         
-        #Visualize object_meshes in a 3D visualization plot to get insight into the patient case
-        object_plotter = ObjectPlotter()
-        object_plotter.add_object(vessel, label=f'{list(object_meshes.keys())[1]}', color="r", alpha=0.2)
-        object_plotter.add_object(tumor, label="tumor", color="y", alpha=0.2)
-        object_plotter.add_points(centerline_points, color="black")
 
+        #Fit a spline through the centerline points and slice at evenly spaced planes along it, the arc length of every plane
+        #gives the exact contact length and the rotation-minimizing reference vectors give every plane the same in-plane x
+        #axis, so the line numbers line up between the planes
+        centerline = Centerline(centerline_points)
+        arc_lengths, centerline_points, normal_points, reference_vectors = centerline.planes(number_of_slices)
 
-    # ============================================================
-    # Create planes, compute intersections and create contours
-    # ============================================================
+        if visualize:
+            #Visualize object_meshes in a 3D visualization plot to get insight into the patient case
+            object_plotter = visualization.ObjectPlotter(preview_faces)
+            object_plotter.add_object(vessel, label=f'{list(object_meshes.keys())[1]}', color="r", alpha=0.2)
+            object_plotter.add_object(tumor, label="tumor", color="y", alpha=0.2)
+            object_plotter.add_points(centerline_points, color="black")
 
-    #Compute intersection points with planes perpendicular to the direction of the centerline of a specific vessel
-    intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points, normal_points)
+            #Add the example plane as mesh to the visualization
+            mesh = visualization.create_plane_mesh(centerline_points[example_plane], normal_points[example_plane], plane_size=13)
+            object_plotter.add_object(mesh, label="plane", color="b", alpha=0.3)
+            title = "Visualizations of the mock-case with the 3D tumor and vessel mesh including an example 2D slice plane" #Set title for the figure
+            object_plotter.set_settings(title)
+            figures["objects"] = object_plotter
 
-    #Add the example plane as mesh to the visualization
-    mesh = create_plane_mesh(centerline_points[example_plane], normal_points[example_plane], plane_size=13)
-    object_plotter.add_object(mesh, label="plane", color="b", alpha=0.3)
+        #Degree between two lines after an optional refinement
+        line_degree = per_degree if angular_resolution is None else angular_resolution
 
-    #Create a contour per object mesh per plane from intersection points
-    all_contours = create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points)
+        #Build a spatial index over the faces of every object mesh once, so every plane only tests the faces it can cut
+        with profiling.stage("face index"):
+            face_indices = build_face_indices(object_meshes)
 
-    #Filter contours to only achieve the planes in which the tumor is present
-    all_contours_filtered = filter_planes(all_contours)
+        #Only slice the planes that can contain contact (cut the tumor and a vessel near the tumor), the example plane is
+        #always sliced for the visualization
+        with profiling.stage("candidate planes"):
+            plane_indices = np.union1d(contact_candidate_planes(object_meshes, centerline_points, normal_points, vessel_wall, face_indices), [example_plane])
 
+        if workers > 1:
+            # ============================================================
+            # Run all per-plane stages for chunks of planes in parallel
+            # ============================================================
 
-    # ================================================================
-    # Create lines, compute intersections, calculate distances, filter 
-    # ================================================================
+            #Slicing, contour creation, line intersections and distances per chunk of planes, merged in plane order
+            with profiling.stage("per-plane stages"), PlaneExecutor(workers, chunk_size) as executor:
+                all_contours, ray_hits, all_distances = executor.run(object_meshes, centerline_points, normal_points, per_degree,
+                                                                     angular_resolution, vessel_wall, plane_indices, reference_vectors)
+            with profiling.stage("filter planes"):
+                all_contours_filtered = filter_planes(all_contours)
 
-    #Compute lines and intersection points for every line for every object in every plane
-    all_intersections, lines = line_intersections(all_contours_filtered, per_degree)
-
-    #Visualize intersection points for every line for every object a plane as example
-    contour_plotter = ContourPlotter()
-    plane_intersection = all_intersections[f'plane{example_plane}']
-    plane_contour = all_contours_filtered[f'plane{example_plane}']
-    for object_mesh in plane_contour:
-        if "tumor" in object_mesh:
-            count = 0 #in order to only add the label once to the legend
-            for line in plane_contour[object_mesh].geoms:
-                if count == 0:
-                    contour_plotter.add_contour(line, label="tumor", color="y", linewidth=4)
-                    count += 1
-                else:
-                    contour_plotter.add_contour(line, color="y", linewidth=4)
         else:
-            count = 0 #in order to only add the label once to the legend
-            for line in plane_contour[object_mesh].geoms:
-                if count == 0:
-                    contour_plotter.add_contour(line, label=(f'{object_mesh}'), color="r", linewidth=4)
-                    count += 1
+            # ============================================================
+            # Create planes, compute intersections and create contours
+            # ============================================================
+
+            if cache_directory is not None:
+                #Reuse the intersections and contours if the meshes and centerline did not change. The cache holds all planes
+                #that cut the tumor, so changing vessel_wall selects other cached planes instead of slicing again
+                with profiling.stage("cached slicing and contours"):
+                    tumor_planes = np.union1d(contact_candidate_planes(object_meshes, centerline_points, normal_points, None, face_indices), [example_plane])
+                    intersections_with_planes, all_contours = cached_planes(SliceCache(cache_directory), object_meshes, centerline_points,
+                                                                            normal_points, face_indices, tumor_planes, reference_vectors)
+                    selected_planes = {f'plane{plane_index}' for plane_index in plane_indices.tolist()}
+                    intersections_with_planes = {plane: intersections_with_planes[plane] for plane in intersections_with_planes if plane in selected_planes}
+                    all_contours = {plane: all_contours[plane] for plane in all_contours if plane in selected_planes}
+            else:
+                #Compute intersection points with planes perpendicular to the direction of the centerline of a specific vessel
+                with profiling.stage("slicing"):
+                    intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                                 face_indices, plane_indices)
+
+                #Create a contour per object mesh per plane from intersection points
+                with profiling.stage("contours"):
+                    all_contours = create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                                           reference_vectors)
+
+            #Filter contours to only achieve the planes in which the tumor is present
+            with profiling.stage("filter planes"):
+                all_contours_filtered = filter_planes(all_contours)
+
+            # ================================================================
+            # Create lines, compute intersections, calculate distances
+            # ================================================================
+
+            #Compute the distance from the centroid of the vessel to the closest intersection of every line with every object in every plane
+            with profiling.stage("line intersections"):
+                ray_hits = line_hit_distances(all_contours_filtered, per_degree, angular_resolution, vessel_wall)
+
+            #Compute distances per plane per line between the tumor and the vessel
+            with profiling.stage("distances"):
+                all_distances = calculate_distance(ray_hits)
+
+        if visualize:
+            #Visualize intersection points for every line for every object a plane as example
+            contour_plotter = visualization.ContourPlotter()
+            plane_intersection = ray_hits.points(ray_hits.row(example_plane))
+            plane_contour = all_contours_filtered[f'plane{example_plane}']
+            for object_mesh in plane_contour:
+                if "tumor" in object_mesh:
+                    count = 0 #in order to only add the label once to the legend
+                    for line in plane_contour[object_mesh].geoms:
+                        if count == 0:
+                            contour_plotter.add_contour(line, label="tumor", color="y", linewidth=4)
+                            count += 1
+                        else:
+                            contour_plotter.add_contour(line, color="y", linewidth=4)
                 else:
-                    contour_plotter.add_contour(line, color="r", linewidth=4)
-    for line in plane_intersection:
-        count = 0 #in order to only add one point to the legend
-        for mesh in plane_intersection[line]:
-            if count == 0:
-                contour_plotter.add_point(plane_intersection[line][mesh], color="b", marker="o", markersize=2)
-                count +=1
-            else: 
-                contour_plotter.add_point(plane_intersection[line][mesh], color="b", marker="o", markersize=2)
-        
-    #Compute distances per plane per line between the tumor and the vessel 
-    all_distances = calculate_distance(all_intersections)
+                    count = 0 #in order to only add the label once to the legend
+                    for line in plane_contour[object_mesh].geoms:
+                        if count == 0:
+                            contour_plotter.add_contour(line, label=(f'{object_mesh}'), color="r", linewidth=4)
+                            count += 1
+                        else:
+                            contour_plotter.add_contour(line, color="r", linewidth=4)
+            contour_plotter.add_points(plane_intersection.reshape(-1, 2), color="b", marker="o", markersize=2)
+            title = "Visualization of a 2D cross-sectional plane with and intersection points with all lines" #Set title of figure
+            contour_plotter.set_settings(title)
+            figures["example_plane"] = contour_plotter
 
-    #Filter distances to get the planes where there is at least one contact point
-    all_distances_filtered = filter_distances(all_distances, vessel_wall)
+        # ================================================================
+        # Filter distances
+        # ================================================================
 
-    #If there is no contact, break the main function
-    if len(all_distances_filtered.keys()) == 0:
-        print('There is no contact between the vessel and the tumor')
-        return
+        #Filter distances to get the planes where there is at least one contact point
+        with profiling.stage("filter distances"):
+            all_distances_filtered = filter_distances(all_distances, vessel_wall)
 
-    # ================================================================
-    # Compute maximum contact length and angles of encasement 
-    # ================================================================
+        #If there is no contact, skip the features
+        if len(all_distances_filtered) == 0:
+            print('There is no contact between the vessel and the tumor')
+        else:
+            # ================================================================
+            # Compute maximum contact length and angles of encasement 
+            # ================================================================
 
-    #Calculate the maximum contact length and provide in which planes this contact is made and visualize this
-    maximum_contact_length, plane_numbers_maximum_contact_length = feature_maximum_contact_length(all_distances_filtered, centerline_points)
-    print(f'The maximum contact length is {maximum_contact_length} mm and present in the following planes')
-    print(f'{plane_numbers_maximum_contact_length}')
+            #Calculate the maximum contact length and provide in which planes this contact is made and visualize this
+            with profiling.stage("contact length"):
+                maximum_contact_length, plane_numbers_maximum_contact_length = feature_maximum_contact_length(all_distances_filtered, centerline_points,
+                                                                                                             arc_lengths)
+            print(f'The maximum contact length is {maximum_contact_length} mm and present in the following planes')
+            print(f'{plane_numbers_maximum_contact_length}')
     
-    object_plotter2 = ObjectPlotter()
-    object_plotter2.add_object(vessel, label=f'{list(object_meshes.keys())[1]}', color="r", alpha=0.2)
-    object_plotter2.add_object(tumor, label="tumor", color="y", alpha=0.2)
-    object_plotter2.add_points(centerline_points, color="black")
+            if visualize:
+                object_plotter2 = visualization.ObjectPlotter(preview_faces)
+                object_plotter2.add_object(vessel, label=f'{list(object_meshes.keys())[1]}', color="r", alpha=0.2)
+                object_plotter2.add_object(tumor, label="tumor", color="y", alpha=0.2)
+                object_plotter2.add_points(centerline_points, color="black")
     
-    mesh1 = create_plane_mesh(centerline_points[plane_numbers_maximum_contact_length[0]], normal_points[plane_numbers_maximum_contact_length[0]], plane_size=13)
-    object_plotter2.add_object(mesh1, label="plane", color="b", alpha=0.3)
+                mesh1 = visualization.create_plane_mesh(centerline_points[plane_numbers_maximum_contact_length[0]], normal_points[plane_numbers_maximum_contact_length[0]], plane_size=13)
+                object_plotter2.add_object(mesh1, label="plane", color="b", alpha=0.3)
     
-    mesh2 = create_plane_mesh(centerline_points[plane_numbers_maximum_contact_length[-1]], normal_points[plane_numbers_maximum_contact_length[-1]], plane_size=13)
-    object_plotter2.add_object(mesh2, label="plane", color="b", alpha=0.3)
-
-    #Calculate the angle of encasement of the tumor around the vessel
-    all_angles = feature_angles(all_distances_filtered, per_degree, minimum_degrees)
-
-    #Print angles per plane
-    for plane in all_angles:
-        for angle in all_angles[plane]:
-            print(f'An angle of encasement for {plane} is {angle.replace("_", " ")}')
-
-    #Visualize planes with given angle
-    for plane in all_angles:
-        contour_plotter2 = ContourPlotter()
-        plane_contour = all_contours_filtered[plane]
-        for object_mesh in plane_contour:
-            if "tumor" in object_mesh:
-                count = 0 #in order to only add the label once to the legend
-                for line in plane_contour[object_mesh].geoms:
-                    if count == 0:
-                        contour_plotter2.add_contour(line, label="tumor", color="y", linewidth=4)
-                        count += 1
-                    else:
-                        contour_plotter2.add_contour(line, color="y", linewidth=4)
-            else:
-                count = 0 #in order to only add the label once to the legend
-                for line in plane_contour[object_mesh].geoms:
-                    if count == 0:
-                        contour_plotter2.add_contour(line, label=(f'{object_mesh}'), color="r", linewidth=4)
-                        count += 1
-                    else:
-                        contour_plotter2.add_contour(line, color="r", linewidth=4)
+                mesh2 = visualization.create_plane_mesh(centerline_points[plane_numbers_maximum_contact_length[-1]], normal_points[plane_numbers_maximum_contact_length[-1]], plane_size=13)
+                object_plotter2.add_object(mesh2, label="plane", color="b", alpha=0.3)
+                title = "Visualization of the 3D tumor and vessel mesh including the first and last plane of the maximum contact length" #Set title of figure
+                object_plotter2.set_settings(title)
+                figures["maximum_contact_length"] = object_plotter2
+
+            #Calculate the angle of encasement of the tumor around the vessel
+            with profiling.stage("angles"):
+                all_angles = feature_angles(all_distances_filtered, line_degree, minimum_degrees)
+
+            #Print angles per plane
+            for plane_index, angle, first_line, last_line in all_angles:
+                print(f'An angle of encasement for plane{plane_index} is Angle {angle:g} degrees')
+
+            if visualize:
+                #Visualize the planes with an angle in one figure with a plot per plane
+                angle_planes = all_angles.planes()
+                plane_grid = visualization.PlaneGrid(len(angle_planes))
+                figures["angles"] = plane_grid
+                for number, plane_index in enumerate(angle_planes):
+                    contour_plotter2 = plane_grid.plotter(number)
+                    row = ray_hits.row(plane_index)
+                    lines = create_lines(line_degree, ray_hits.origins[row], ray_hits.line_lengths[row])
+                    plane_contour = all_contours_filtered[f'plane{plane_index}']
+                    for object_mesh in plane_contour:
+                        if "tumor" in object_mesh:
+                            count = 0 #in order to only add the label once to the legend
+                            for line in plane_contour[object_mesh].geoms:
+                                if count == 0:
+                                    contour_plotter2.add_contour(line, label="tumor", color="y", linewidth=4)
+                                    count += 1
+                                else:
+                                    contour_plotter2.add_contour(line, color="y", linewidth=4)
+                        else:
+                            count = 0 #in order to only add the label once to the legend
+                            for line in plane_contour[object_mesh].geoms:
+                                if count == 0:
+                                    contour_plotter2.add_contour(line, label=(f'{object_mesh}'), color="r", linewidth=4)
+                                    count += 1
+                                else:
+                                    contour_plotter2.add_contour(line, color="r", linewidth=4)
                         
-        #Plot the two lines that create the angle
-        count = 0 #in order to be able to give the lines a different color if there are a maximum of four angles
-        for angle in all_angles[plane]:
-            #First line
-            first_line_number = all_angles[plane][angle][0]
-            first_line = int(first_line_number[4:])
-            
-            #Second line
-            second_line_number = all_angles[plane][angle][1]
-            second_line = int(second_line_number[4:])
+                    #Plot the two lines that create the angle
+                    count = 0 #in order to be able to give the lines a different color if there are a maximum of four angles
+                    for angle, first_line, second_line in all_angles.for_plane(plane_index):
             
-            if count <= 1 or 3 < count < 5: 
-            #Plot
-                contour_plotter2.add_contour(lines[first_line], color="black", linestyle="--")
-                contour_plotter2.add_contour(lines[second_line], color="black", linestyle="--")
-                title = f'{angle.replace("_", " ")} for {plane}' #Set title for the figure
-                contour_plotter2.set_settings(title)
-                count += 2
+                        if count <= 1 or 3 < count < 5: 
+                        #Plot
+                            contour_plotter2.add_contour(lines[first_line], color="black", linestyle="--")
+                            contour_plotter2.add_contour(lines[second_line], color="black", linestyle="--")
+                            title = f'Angle {angle:g} degrees for plane{plane_index}' #Set title for the figure
+                            contour_plotter2.set_settings(title)
+                            count += 2
             
-            else:
-                contour_plotter2.add_contour(lines[first_line], color="m", linestyle="--")
-                contour_plotter2.add_contour(lines[second_line], color="m", linestyle="--")
-                title = f'{angle.replace("_", " ")} for {plane}' #Set title for the figure
-                contour_plotter2.set_settings(title)
-                count += 2
-
-    #Show all figures
-    title = "Visualizations of the mock-case with the 3D tumor and vessel mesh including an example 2D slice plane" #Set title for the figure
-    object_plotter.set_settings(title)
-    title = "Visualization of a 2D cross-sectional plane with and intersection points with all lines" #Set title of figure
-    contour_plotter.set_settings(title)
-    title = "Visualization of the 3D tumor and vessel mesh including the first and last plane of the maximum contact length" #Set title of figure
-    object_plotter2.set_settings(title)
-    plt.show()
+                        else:
+                            contour_plotter2.add_contour(lines[first_line], color="m", linestyle="--")
+                            contour_plotter2.add_contour(lines[second_line], color="m", linestyle="--")
+                            title = f'Angle {angle:g} degrees for plane{plane_index}' #Set title for the figure
+                            contour_plotter2.set_settings(title)
+                            count += 2
+
+    finally:
+        if profile:
+            print(profiling.format_report())
+            profiling.disable()
+
+    if visualize:
+        #Show all figures, or write them to figure_directory, also the figures created before a run without contact
+        visualization.show_figures(figures, figure_directory, figure_format)
 
 
 # ============================================================
@@ -0,0 +1,79 @@
+"""
+Adaptive slicing
+================
+
+Coarse-to-fine slicing along a Centerline. The vessel is first sliced with a few evenly spaced planes, then planes are
+only added halfway between two neighbouring planes of which one has contact between the tumor and the vessel and the
+other does not, until these intervals are shorter than length_tolerance. The start and end of every contact region are
+then known within length_tolerance while the planes far from a contact boundary are never sliced.
+Note that a contact region shorter than the coarse spacing can fall between two coarse planes and is not found.
+"""
+
+#Import packages
+import numpy as np
+
+#Import modules
+from scripts.pipeline import stream_planes
+from scripts.line_intersections import line_angles
+from scripts.results import DistanceMatrix
+from scripts.features import feature_angles, longest_consecutive_planes, contact_length
+
+
+def contact_distances(object_meshes, centerline, arc_lengths, per_degree, vessel_wall, angular_resolution=None, face_indices=None):
+    """Slice the planes at the given arc lengths and return the filtered DistanceMatrix of the planes with contact,
+    its plane numbers are the positions in arc_lengths"""
+    line_degree = per_degree if angular_resolution is None else angular_resolution
+    centerline_points = centerline.points_at(arc_lengths)
+    normal_points = centerline.tangents_at(arc_lengths)
+    return DistanceMatrix.concatenate(list(stream_planes(object_meshes, centerline_points, normal_points, per_degree, vessel_wall,
+                                                         angular_resolution, face_indices)), line_angles(line_degree))
+
+
+def adaptive_contact_planes(object_meshes, centerline, per_degree, vessel_wall, coarse_slices=10, length_tolerance=0.5,
+                            angular_resolution=None, face_indices=None):
+    """Slice coarsely and refine near the contact boundaries, see the module docstring.
+    Return the arc lengths of all sliced planes in ascending order and the filtered DistanceMatrix of the planes with
+    contact, whose plane numbers are the positions in these arc lengths (so neighbouring planes have consecutive numbers)"""
+    arc_lengths = np.linspace(0, centerline.length, coarse_slices)
+    distance_matrices = []
+    new_arc_lengths = arc_lengths
+
+    while len(new_arc_lengths):
+        #Slice the new planes, their plane numbers continue after the planes sliced before
+        distances = contact_distances(object_meshes, centerline, new_arc_lengths, per_degree, vessel_wall, angular_resolution, face_indices)
+        distances.plane_indices += len(arc_lengths) - len(new_arc_lengths)
+        distance_matrices.append(distances)
+
+        #Contact per plane in the order along the centerline
+        order = np.argsort(arc_lengths, kind="stable")
+        contact = np.zeros(len(arc_lengths), dtype=bool)
+        for matrix in distance_matrices:
+            contact[matrix.plane_indices] = True
+        sorted_arc_lengths = arc_lengths[order]
+        sorted_contact = contact[order]
+
+        #Bisect the intervals in which the contact starts or ends until they are shorter than the tolerance
+        boundaries = np.nonzero((sorted_contact[1:] != sorted_contact[:-1]) & (np.diff(sorted_arc_lengths) > length_tolerance))[0]
+        new_arc_lengths = (sorted_arc_lengths[boundaries] + sorted_arc_lengths[boundaries + 1]) / 2
+        arc_lengths = np.concatenate([arc_lengths, new_arc_lengths])
+
+    #Renumber the planes by their position along the centerline
+    order = np.argsort(arc_lengths, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    distances = DistanceMatrix.concatenate(distance_matrices, line_angles(per_degree if angular_resolution is None else angular_resolution))
+    distances.plane_indices = rank[distances.plane_indices]
+    return arc_lengths[order], distances.select(np.argsort(distances.plane_indices, kind="stable"))
+
+
+def adaptive_features(object_meshes, centerline, per_degree, vessel_wall, minimum_degrees, coarse_slices=10, length_tolerance=0.5,
+                      angular_resolution=None, face_indices=None):
+    """Compute the maximum contact length, its planes and the angles of encasement with adaptive slicing.
+    Return the maximum contact length, its plane numbers, an EncasementAngles container and the arc lengths of the planes"""
+    arc_lengths, distances = adaptive_contact_planes(object_meshes, centerline, per_degree, vessel_wall, coarse_slices, length_tolerance,
+                                                     angular_resolution, face_indices)
+    line_degree = per_degree if angular_resolution is None else angular_resolution
+
+    plane_numbers_longest_streak = longest_consecutive_planes(distances.plane_indices.tolist())
+    maximum_contact_length = contact_length(plane_numbers_longest_streak, centerline.points_at(arc_lengths), arc_lengths)
+    return maximum_contact_length, plane_numbers_longest_streak, feature_angles(distances, line_degree, minimum_degrees), arc_lengths
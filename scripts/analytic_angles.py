@@ -0,0 +1,131 @@
+"""
+Analytic angles of encasement
+=============================
+
+Alternative to counting lines: the part of the vessel contour that lies within vessel_wall of the tumor is found by
+intersecting the vessel contour with the tumor polygon buffered by vessel_wall. Every resulting piece of the vessel
+contour covers an interval of directions as seen from the center of the lines, the merged intervals are the angles of
+encasement. The angles do not depend on per_degree and the cost is linear in the number of contour segments.
+Note that the distance to the tumor is measured in any direction, while the lines only compare the tumor and vessel
+along the same direction, so at the sides of the tumor an arc extends further than the lines with contact.
+"""
+
+#Import packages
+import numpy as np
+
+#Import modules
+from scripts.plane_intersections import iter_intersection_planes_with_objects, contact_candidate_planes
+from scripts.pipeline import iter_contours, iter_filter_planes
+from scripts.line_intersections import vessel_centroids
+from scripts.features import longest_consecutive_planes, contact_length
+from scripts.results import EncasementArcs
+from scripts import lazy_imports, profiling
+
+
+def contour_polygon(contour):
+    """Fill the closed rings of a contour (MultiLineString) into one polygon"""
+    shapely = lazy_imports.shapely()
+    return shapely.union_all(shapely.get_parts(shapely.polygonize(shapely.get_parts(contour))))
+
+
+def contact_pieces(contours, vessel_wall):
+    """Return the pieces of the vessel contours of one plane that are within vessel_wall of the tumor"""
+    shapely = lazy_imports.shapely()
+    tumor = shapely.union_all([contour_polygon(contours[object_mesh]) for object_mesh in contours if "tumor" in object_mesh])
+    vessels = shapely.union_all([contours[object_mesh] for object_mesh in contours if "tumor" not in object_mesh])
+    if tumor.is_empty or vessels.is_empty:
+        return []
+    return [piece for piece in shapely.get_parts(shapely.line_merge(vessels.intersection(tumor.buffer(vessel_wall))))
+            if piece.geom_type == "LineString" and not piece.is_empty]
+
+
+def angular_intervals(pieces, center=(0, 0)):
+    """Interval of directions covered by every piece as seen from center.
+    Return the start directions in [0, 360) degrees and the extents in degrees"""
+    shapely = lazy_imports.shapely()
+    starts, extents = [], []
+    for piece in pieces:
+        coordinates = shapely.get_coordinates(piece) - center
+        directions = np.unwrap(np.arctan2(coordinates[:, 1], coordinates[:, 0]))
+        starts.append(np.degrees(directions.min()) % 360)
+        extents.append(np.degrees(directions.max() - directions.min()))
+    return np.array(starts), np.array(extents)
+
+
+def merge_circular_intervals(starts, extents):
+    """Merge overlapping intervals on the circle, return the merged start directions and extents in degrees"""
+    if len(starts) == 0:
+        return np.zeros(0), np.zeros(0)
+    order = np.argsort(starts)
+    starts, ends = starts[order], starts[order] + extents[order]
+
+    merged_starts, merged_ends = [starts[0]], [ends[0]]
+    for start, end in zip(starts[1:].tolist(), ends[1:].tolist()):
+        if start <= merged_ends[-1]:
+            merged_ends[-1] = max(merged_ends[-1], end)
+        else:
+            merged_starts.append(start)
+            merged_ends.append(end)
+
+    #The last interval can continue past 360 degrees into the first intervals
+    while len(merged_starts) > 1 and merged_ends[-1] >= merged_starts[0] + 360:
+        merged_ends[-1] = max(merged_ends[-1], merged_ends[0] + 360)
+        merged_starts.pop(0)
+        merged_ends.pop(0)
+
+    merged_starts, merged_ends = np.array(merged_starts), np.array(merged_ends)
+    extents = merged_ends - merged_starts
+    if extents.max() >= 360:
+        return np.zeros(1), np.full(1, 360.0)
+    return merged_starts, extents
+
+
+def plane_arcs(contours, vessel_wall, center=(0, 0)):
+    """Return the start directions and angles in degrees of the merged contact arcs of one plane"""
+    return merge_circular_intervals(*angular_intervals(contact_pieces(contours, vessel_wall), center))
+
+
+def analytic_angles(all_contours_filtered, vessel_wall, minimum_degrees, centers=None):
+    """Calculate the angles of encasement of every plane analytically. all_contours_filtered is a dictionary or a
+    stream of (plane, contours) pairs, centers optionally gives the center of the lines per plane number, by default
+    the centroid of the vessel contour as for the lines.
+    Return an EncasementArcs container with all arcs of at least minimum_degrees and the plane numbers with contact"""
+    items = all_contours_filtered.items() if isinstance(all_contours_filtered, dict) else all_contours_filtered
+    plane_indices, angles, start_angles = [], [], []
+    contact_planes = []
+
+    for plane, contours in items:
+        plane_index = int(plane.split("plane")[1])
+        with profiling.stage("angles"):
+            center = vessel_centroids({plane: contours})[0][0] if centers is None else centers[plane_index]
+            starts, extents = plane_arcs(contours, vessel_wall, center)
+        if len(starts):
+            contact_planes.append(plane_index)
+        keep = extents >= minimum_degrees
+        plane_indices.extend([plane_index] * int(keep.sum()))
+        angles.extend(extents[keep].tolist())
+        start_angles.extend(starts[keep].tolist())
+
+    start_angles = np.array(start_angles)
+    end_angles = (start_angles + np.array(angles)) % 360
+    return EncasementArcs(plane_indices, angles, start_angles, end_angles), contact_planes
+
+
+def stream_analytic_features(object_meshes, centerline_points, normal_points, vessel_wall, minimum_degrees, face_indices=None,
+                             arc_lengths=None, reference_vectors=None):
+    """Compute the maximum contact length, its planes and the angles of encasement with the analytic engine, streaming
+    the planes that can have contact. A plane has contact if any part of the vessel contour is within vessel_wall of the tumor.
+    Return the maximum contact length, its plane numbers and an EncasementArcs container"""
+    with profiling.stage("candidate planes"):
+        plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, vessel_wall, face_indices)
+    intersections_with_planes = iter_intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                      face_indices, plane_indices)
+    intersections_with_planes = profiling.timed("slicing", intersections_with_planes)
+    all_contours_filtered = iter_filter_planes(iter_contours(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                             reference_vectors))
+    all_arcs, contact_planes = analytic_angles(all_contours_filtered, vessel_wall, minimum_degrees)
+
+    with profiling.stage("contact length"):
+        plane_numbers_longest_streak = longest_consecutive_planes(contact_planes)
+        maximum_contact_length = contact_length(plane_numbers_longest_streak, centerline_points, arc_lengths)
+    return maximum_contact_length, plane_numbers_longest_streak, all_arcs
@@ -0,0 +1,328 @@
+"""
+Batch cohort runner
+===================
+
+Process many patient cases without any visualization and write the features of every case to a results file.
+
+Usage:
+    python -m scripts.batch models/mock_cases.json --output results.csv --workers 4
+
+The manifest is a JSON file with optional "defaults" parameters and a list of "cases":
+
+    {
+      "defaults": {"number_of_slices": 20, "per_degree": 1, "minimum_degrees": 40, "vessel_wall": 1.5},
+      "cases": [
+        {"case_id": "case1", "tumor": "case1_tumor.STL", "vessels": {"SMA": "case1_SMA.STL"},
+         "centerline": "straight_cylinder", "parameters": {"number_of_slices": 40}}
+      ]
+    }
+
+Setting the parameter "length_tolerance" (mm) slices adaptively: number_of_slices coarse planes are refined near the start
+and end of the contact until they are known within length_tolerance (scripts.adaptive_slicing).
+
+Setting "angle_method" to "analytic" computes the angles from the part of the vessel contour within vessel_wall of the
+tumor (scripts.analytic_angles).
+
+The "angles" of a row give per plane a list of {"angle", "first_line", "last_line"} with the angle in degrees and its
+first and last line (row numbers of create_lines). With the analytic method the entries are {"angle", "start_degrees",
+"end_degrees"} with the start and end direction of the arc in degrees instead of line numbers.
+
+Paths are relative to the manifest. A mesh is a file readable by trimesh or a directory of the mesh store
+(scripts.mesh_store), which is opened memory-mapped without parsing. The centerline is either the name of a generator in
+scripts.centerline_points ("straight_cylinder" or "case_3"), "auto" to extract it from the vessel mesh with
+number_of_slices evenly spaced planes (scripts.centerline_extraction) or {"points": "points.npy", "normals": "normals.npy"}
+with (n, 3) arrays.
+
+A case may list multiple vessels (e.g. CA, SMA, CHA, SMV and PV), each with its own centerline given as a dictionary per
+vessel, e.g. "centerline": {"SMA": "auto", "PV": {"points": "pv_points.npy", "normals": "pv_normals.npy"}}. A single
+centerline source such as "auto" is used for every vessel. One row per vessel is written.
+"""
+
+#Import packages
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+#Import modules
+from scripts.centerline_points import centerline_straightcylinder, centerline_case_3
+from scripts.centerline_extraction import extract_centerline
+from scripts.centerline import Centerline
+from scripts.spatial_index import build_face_indices
+from scripts.plane_intersections import contact_candidate_planes
+from scripts.mesh_store import load_mesh
+from scripts.parallel import PlaneExecutor
+from scripts.pipeline import stream_planes, stream_features
+from scripts.adaptive_slicing import adaptive_features
+from scripts.multi_vessel import process_vessels
+from scripts.analytic_angles import stream_analytic_features
+from scripts.distances import filter_distances
+from scripts.results import EncasementArcs
+from scripts import profiling
+
+
+DEFAULT_PARAMETERS = {
+    "number_of_slices": 20,
+    "per_degree": 1,
+    "angular_resolution": None,
+    "minimum_degrees": 40,
+    "vessel_wall": 1.5,
+    "length_tolerance": None,
+    "angle_method": "rays",
+}
+
+RESULT_FIELDS = ["case_id", "vessel", "status", "maximum_contact_length", "contact_planes", "angles",
+                 "load_seconds", "compute_seconds", "total_seconds"]
+
+
+def read_manifest(manifest_path):
+    """Read the cases of a manifest, merge the default parameters and make all paths absolute"""
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    if isinstance(manifest, list):
+        manifest = {"cases": manifest}
+
+    base_directory = os.path.dirname(os.path.abspath(manifest_path))
+    defaults = {**DEFAULT_PARAMETERS, **manifest.get("defaults", {})}
+
+    def resolve(path):
+        return os.path.join(base_directory, path)
+
+    def resolve_centerline(centerline):
+        #Either {"points": ..., "normals": ...} or a centerline source per vessel
+        if isinstance(centerline, dict) and "points" in centerline:
+            return {key: resolve(value) for key, value in centerline.items()}
+        if isinstance(centerline, dict):
+            return {vessel: resolve_centerline(source) for vessel, source in centerline.items()}
+        return centerline
+
+    cases = []
+    for number, case in enumerate(manifest["cases"]):
+        centerline = resolve_centerline(case.get("centerline", "straight_cylinder"))
+        cases.append({
+            "case_id": case.get("case_id", f"case{number}"),
+            "tumor": resolve(case["tumor"]),
+            "vessels": {vessel: resolve(path) for vessel, path in case["vessels"].items()},
+            "centerline": centerline,
+            "parameters": {**defaults, **case.get("parameters", {})},
+        })
+    return cases
+
+
+def load_array(path):
+    """Load an (n, 3) array from a .npy file or a comma separated text file"""
+    if path.endswith(".npy"):
+        return np.load(path)
+    return np.loadtxt(path, delimiter=",")
+
+
+def compute_centerline(centerline, number_of_slices, vessel_mesh=None):
+    """Compute the centerline points and normals of a case from its manifest entry"""
+    if centerline == "auto":
+        return extract_centerline(vessel_mesh, number_of_points=number_of_slices)
+    if centerline == "straight_cylinder":
+        return centerline_straightcylinder(number_of_slices)
+    if centerline == "case_3":
+        centerline_points, normal_points, arc_length = centerline_case_3(number_of_slices)
+        return centerline_points, normal_points
+    if isinstance(centerline, dict):
+        return load_array(centerline["points"]), load_array(centerline["normals"])
+    raise ValueError(f"Unknown centerline source {centerline!r}")
+
+
+def angles_per_plane(all_angles):
+    """Convert an EncasementAngles container to a dictionary with per plane a list of {"angle", "first_line", "last_line"}
+    with the line numbers, or an EncasementArcs container to {"angle", "start_degrees", "end_degrees"} with the directions"""
+    fields = ("start_degrees", "end_degrees") if isinstance(all_angles, EncasementArcs) else ("first_line", "last_line")
+    angles = {}
+    for plane_index, angle, start, end in all_angles:
+        angles.setdefault(f"plane{plane_index}", []).append({"angle": angle, fields[0]: start, fields[1]: end})
+    return angles
+
+
+def vessel_centerline_source(centerline, vessel):
+    """Centerline source of a vessel, the manifest gives one source for all vessels or a source per vessel"""
+    if isinstance(centerline, dict) and "points" not in centerline:
+        return centerline[vessel]
+    return centerline
+
+
+def vessel_features(object_meshes, centerline_points, normal_points, parameters, executor=None, arc_lengths=None, reference_vectors=None):
+    """Compute the features of one tumor-vessel pair, arc_lengths and reference_vectors optionally give the arc length and
+    the in-plane x axis of every plane.
+    Return the maximum contact length, its plane numbers and an EncasementAngles container"""
+    line_degree = parameters["angular_resolution"] or parameters["per_degree"]
+    arc_lengths = Centerline(centerline_points).arc_lengths if arc_lengths is None else arc_lengths
+
+    if parameters["angle_method"] == "analytic":
+        #Angles from the vessel contour within vessel_wall of the tumor instead of counting lines
+        return stream_analytic_features(object_meshes, centerline_points, normal_points, parameters["vessel_wall"], parameters["minimum_degrees"],
+                                        build_face_indices(object_meshes), arc_lengths, reference_vectors)
+
+    if parameters["length_tolerance"] is not None:
+        #Adaptive slicing, number_of_slices coarse planes refined near the contact boundaries. The contact planes are then
+        #numbered by their position along the centerline among all sliced planes
+        maximum_contact_length, plane_numbers, all_angles, arc_lengths = adaptive_features(
+            object_meshes, Centerline(centerline_points), parameters["per_degree"], parameters["vessel_wall"],
+            parameters["minimum_degrees"], parameters["number_of_slices"], parameters["length_tolerance"],
+            parameters["angular_resolution"], build_face_indices(object_meshes))
+        return maximum_contact_length, plane_numbers, all_angles
+
+    #Per-plane stages in the worker processes if an executor is provided, otherwise streamed one plane at a time
+    if executor is not None:
+        with profiling.stage("candidate planes"):
+            plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, parameters["vessel_wall"])
+        with profiling.stage("per-plane stages"):
+            all_contours, ray_hits, all_distances = executor.run(
+                object_meshes, centerline_points, normal_points, parameters["per_degree"],
+                parameters["angular_resolution"], parameters["vessel_wall"], plane_indices, reference_vectors)
+        with profiling.stage("filter distances"):
+            all_distances_filtered = [filter_distances(all_distances, parameters["vessel_wall"])]
+    else:
+        all_distances_filtered = stream_planes(object_meshes, centerline_points, normal_points, parameters["per_degree"],
+                                               parameters["vessel_wall"], parameters["angular_resolution"], build_face_indices(object_meshes),
+                                               reference_vectors)
+
+    #Features
+    return stream_features(all_distances_filtered, centerline_points, line_degree, parameters["minimum_degrees"], arc_lengths)
+
+
+def run_case(case, executor=None):
+    """Run the full pipeline for one case without visualization, return a row per vessel with the features and timing.
+    Multiple vessels are processed concurrently with a shared tumor (scripts.multi_vessel), unless the planes are sliced
+    adaptively or by the executor, then the vessels are processed one after the other"""
+    start = time.perf_counter()
+    parameters = case["parameters"]
+
+    #Load data, every vessel has its own centerline
+    with profiling.stage("load"):
+        tumor = load_mesh(case["tumor"])
+        vessel_meshes = {vessel: load_mesh(vessel_path) for vessel, vessel_path in case["vessels"].items()}
+    with profiling.stage("centerline"):
+        centerlines = {vessel: compute_centerline(vessel_centerline_source(case["centerline"], vessel), parameters["number_of_slices"],
+                                                  vessel_meshes[vessel])
+                       for vessel in vessel_meshes}
+
+        #Slice at evenly spaced planes along a spline through every centerline, the rotation-minimizing reference vectors
+        #give every plane the same in-plane x axis
+        planes = {vessel: Centerline(centerlines[vessel][0]).planes() for vessel in centerlines}
+    loaded = time.perf_counter()
+
+    if len(vessel_meshes) > 1 and parameters["length_tolerance"] is None and parameters["angle_method"] == "rays" and executor is None:
+        centerlines = {vessel: (centerline_points, normal_points, reference_vectors, arc_lengths)
+                       for vessel, (arc_lengths, centerline_points, normal_points, reference_vectors) in planes.items()}
+        results = process_vessels({"tumor": tumor}, vessel_meshes, centerlines, parameters["per_degree"], parameters["vessel_wall"],
+                                  parameters["minimum_degrees"], parameters["angular_resolution"])
+    else:
+        #The tumor is always added first and then the vessel
+        results = {}
+        for vessel in vessel_meshes:
+            arc_lengths, centerline_points, normal_points, reference_vectors = planes[vessel]
+            results[vessel] = vessel_features({"tumor": tumor, vessel: vessel_meshes[vessel]}, centerline_points, normal_points, parameters,
+                                              executor, arc_lengths, reference_vectors)
+
+    #Result row per vessel
+    end = time.perf_counter()
+    rows = []
+    for vessel, (maximum_contact_length, plane_numbers, all_angles) in results.items():
+        row = {"case_id": case["case_id"], "vessel": vessel, "status": "ok", "maximum_contact_length": 0.0,
+               "contact_planes": [], "angles": {}}
+        if plane_numbers:
+            row.update(maximum_contact_length=float(maximum_contact_length), contact_planes=[int(plane) for plane in plane_numbers],
+                       angles=angles_per_plane(all_angles))
+        else:
+            row["status"] = "no contact"
+        row.update(load_seconds=loaded - start, compute_seconds=end - loaded, total_seconds=end - start)
+        rows.append(row)
+    return rows
+
+
+class ResultWriter:
+    """Write result rows to a .csv, .jsonl or .parquet file. CSV and JSONL rows are written as soon as a case is finished"""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower().lstrip(".")
+        if self.format not in ("csv", "jsonl", "parquet"):
+            raise ValueError("The results file has to end with .csv, .jsonl or .parquet")
+        self.rows = []
+        self.file = None
+        if self.format != "parquet":
+            self.file = open(path, "w", newline="")
+        if self.format == "csv":
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, row):
+        """Write one result row"""
+        if self.format == "csv":
+            self.csv_writer.writerow({field: json.dumps(row[field]) if isinstance(row.get(field), (list, dict)) else row.get(field)
+                                      for field in RESULT_FIELDS})
+        elif self.format == "jsonl":
+            self.file.write(json.dumps(row) + "\n")
+        else:
+            self.rows.append(row)
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        """Close the file, parquet files are written here and need pandas with pyarrow or fastparquet"""
+        if self.format == "parquet":
+            import pandas as pd
+            table = pd.DataFrame([{field: json.dumps(row[field]) if isinstance(row.get(field), (list, dict)) else row.get(field)
+                                   for field in RESULT_FIELDS} for row in self.rows])
+            table.to_parquet(self.path)
+        if self.file is not None:
+            self.file.close()
+
+
+def run_batch(manifest_path, output_path, workers=1, chunk_size=8):
+    """Run all cases of the manifest and write a row per case and vessel to output_path. A failing case is recorded with its
+    error message and the remaining cases continue. Return the list of rows"""
+    cases = read_manifest(manifest_path)
+    writer = ResultWriter(output_path)
+
+    #One process pool for all cases
+    executor = PlaneExecutor(workers, chunk_size) if workers > 1 else None
+    rows = []
+    try:
+        for case in cases:
+            start = time.perf_counter()
+            try:
+                with profiling.stage("case"):
+                    case_rows = run_case(case, executor)
+            except Exception as error:
+                case_rows = [{"case_id": case["case_id"], "vessel": ",".join(case["vessels"]), "status": f"error: {error}",
+                              "total_seconds": time.perf_counter() - start}]
+            for row in case_rows:
+                print(f'{row["case_id"]} {row["vessel"]}: {row["status"]} ({row["total_seconds"]:.2f} s)')
+                writer.write(row)
+                rows.append(row)
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.close()
+    return rows
+
+
+def main(arguments=None):
+    """Command line entry point of the batch runner"""
+    parser = argparse.ArgumentParser(description="Process a cohort of cases without visualization")
+    parser.add_argument("manifest", help="JSON manifest with the cases")
+    parser.add_argument("--output", default="results.csv", help="Results file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes, reused for all cases")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Number of planes per parallel task")
+    parser.add_argument("--profile", action="store_true", help="Print the time and CPU time per case and per stage and the counters of this process at the end")
+    arguments = parser.parse_args(arguments)
+    if arguments.profile:
+        profiling.enable()
+    run_batch(arguments.manifest, arguments.output, arguments.workers, arguments.chunk_size)
+    if arguments.profile:
+        print(profiling.format_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Benchmarks
+==========
+
+Reproducible benchmarks of the full pipeline and of every stage over the three mock cases. For every case the number
+of slices, per_degree and the mesh resolution (the case meshes subdivided 0, 1 or 2 times, 4 times more faces per
+subdivision with the same geometry) are swept one at a time. Every configuration is run repeats times and the fastest
+run is kept, a separate run traces the peak memory. The latency per stage, the throughput of the slicing (planes/s) and
+of the lines (rays/s), the peak memory and the counters are written to a JSON baseline, and a later run can be compared
+with a baseline to catch regressions:
+
+    python -m scripts.benchmark --save benchmark_baseline.json
+    python -m scripts.benchmark --compare benchmark_baseline.json --tolerance 0.25
+
+A baseline is specific to the machine it was recorded on and is therefore not part of the repository.
+"""
+
+#Import packages
+import argparse
+import json
+import os
+import platform
+import sys
+
+import numpy as np
+
+#Import modules
+from scripts import lazy_imports, profiling
+from scripts.centerline_points import centerline_straightcylinder, centerline_case_3
+from scripts.centerline import Centerline
+from scripts.mesh_store import load_mesh
+from scripts.spatial_index import build_face_indices
+from scripts.plane_intersections import intersection_planes_with_objects, contact_candidate_planes
+from scripts.contour_creation import create_contour_from_intersection_points
+from scripts.line_intersections import filter_planes, line_hit_distances
+from scripts.distances import calculate_distance, filter_distances
+from scripts.features import feature_maximum_contact_length, feature_angles
+
+
+#Directory of the mock case meshes, independent of the working directory
+MODELS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+
+#Increase when the benchmark configurations or the recorded values change, baselines of another version are not compared
+BENCHMARK_VERSION = 2
+
+#Parameters that are not swept
+VESSEL_WALL = 1.5
+MINIMUM_DEGREES = 40
+
+#Sweeps per case, every sweep varies one parameter of (number_of_slices, per_degree, subdivisions)
+SWEEPS = {
+    "number_of_slices": [(20, 1, 0), (50, 1, 0), (100, 1, 0)],
+    "per_degree": [(20, 1, 0), (20, 0.5, 0), (20, 0.25, 0)],
+    "subdivisions": [(20, 1, 0), (20, 1, 1), (20, 1, 2)],
+}
+
+#Stages that are compared with the baseline besides the total
+COMPARED_STAGES = ("slicing", "line intersections")
+
+#Counters that do not depend on the machine, a difference with the baseline means the results changed
+COMPARED_COUNTERS = ("planes", "faces_tested", "segments", "rays", "hits")
+
+
+def load_case(mock_case, number_of_slices, subdivisions=0):
+    """Load the meshes of a mock case, subdivided subdivisions times, and the arc lengths, centerline points, normals and
+    reference vectors of its planes as in main.py"""
+    object_meshes = {"tumor": load_mesh(os.path.join(MODELS_DIRECTORY, f'case{mock_case}_tumor.STL')),
+                     "SMA": load_mesh(os.path.join(MODELS_DIRECTORY, f'case{mock_case}_SMA.STL'))}
+    for _ in range(subdivisions):
+        object_meshes = {object_mesh: object_meshes[object_mesh].subdivide() for object_mesh in object_meshes}
+
+    if mock_case == 3:
+        centerline_points, normal_points, _ = centerline_case_3(number_of_slices)
+    else:
+        centerline_points, normal_points = centerline_straightcylinder(number_of_slices)
+    return (object_meshes,) + Centerline(centerline_points).planes(number_of_slices)
+
+
+def run_pipeline(object_meshes, arc_lengths, centerline_points, normal_points, reference_vectors, per_degree, vessel_wall=VESSEL_WALL,
+                 minimum_degrees=MINIMUM_DEGREES):
+    """Run the serial pipeline of main.py without visualization, every stage is measured by scripts.profiling.
+    Return the maximum contact length and the angles of encasement"""
+    with profiling.stage("total"):
+        with profiling.stage("face index"):
+            face_indices = build_face_indices(object_meshes)
+        with profiling.stage("candidate planes"):
+            plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, vessel_wall, face_indices)
+        with profiling.stage("slicing"):
+            intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                         face_indices, plane_indices)
+        with profiling.stage("contours"):
+            all_contours = create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                                   reference_vectors)
+        with profiling.stage("filter planes"):
+            all_contours_filtered = filter_planes(all_contours)
+        with profiling.stage("line intersections"):
+            ray_hits = line_hit_distances(all_contours_filtered, per_degree)
+        with profiling.stage("distances"):
+            all_distances = calculate_distance(ray_hits)
+        with profiling.stage("filter distances"):
+            all_distances_filtered = filter_distances(all_distances, vessel_wall)
+        with profiling.stage("contact length"):
+            maximum_contact_length, plane_numbers = feature_maximum_contact_length(all_distances_filtered, centerline_points, arc_lengths)
+        with profiling.stage("angles"):
+            all_angles = feature_angles(all_distances_filtered, per_degree, minimum_degrees)
+    return maximum_contact_length, all_angles
+
+
+def measure(object_meshes, planes, per_degree, repeats=5):
+    """Run the pipeline on the planes of load_case repeats times and once more with traced memory.
+    Return the fastest wall time per stage, the throughput, the peak memory and the counters of one run"""
+    latencies = {}
+    for _ in range(repeats):
+        profiling.reset()
+        profiling.enable()
+        try:
+            run_pipeline(object_meshes, *planes, per_degree)
+        finally:
+            profiling.disable()
+        profile = profiling.report()
+        for name, totals in profile["stages"].items():
+            latencies[name] = min(latencies.get(name, np.inf), totals["wall_seconds"])
+    counters = profile["counters"]
+
+    #The traced memory slows down the allocations, so it is measured in a separate run
+    profiling.reset()
+    profiling.enable(trace_memory=True)
+    try:
+        run_pipeline(object_meshes, *planes, per_degree)
+    finally:
+        profiling.disable()
+    peak_memory = profiling.report()["stages"]["total"]["peak_memory_bytes"]
+    profiling.reset()
+
+    return {
+        "latency_seconds": latencies,
+        "planes_per_second": counters.get("planes", 0) / latencies["slicing"] if latencies["slicing"] > 0 else None,
+        "rays_per_second": counters.get("rays", 0) / latencies["line intersections"] if latencies["line intersections"] > 0 else None,
+        "peak_memory_bytes": peak_memory,
+        "counters": counters,
+    }
+
+
+def configuration_key(mock_case, number_of_slices, per_degree, subdivisions):
+    """Name of a benchmark configuration in the baseline"""
+    return f"case{mock_case}/slices{number_of_slices}/degree{per_degree:g}/subdivisions{subdivisions}"
+
+
+def run_benchmarks(mock_cases=(1, 2, 3), repeats=5, sweeps=None):
+    """Run every configuration of the sweeps for the mock cases, configurations shared by sweeps are run once.
+    Return the benchmark results as a dictionary"""
+    sweeps = SWEEPS if sweeps is None else sweeps
+    results = {}
+    for mock_case in mock_cases:
+        for configuration in dict.fromkeys(configuration for sweep in sweeps.values() for configuration in sweep):
+            number_of_slices, per_degree, subdivisions = configuration
+            key = configuration_key(mock_case, *configuration)
+            object_meshes, *planes = load_case(mock_case, number_of_slices, subdivisions)
+            results[key] = measure(object_meshes, planes, per_degree, repeats)
+            results[key]["faces"] = sum(len(object_meshes[object_mesh].faces) for object_mesh in object_meshes)
+            print(f'{key}: {results[key]["latency_seconds"]["total"] * 1000:.1f} ms')
+
+    return {"version": BENCHMARK_VERSION, "machine": {"platform": platform.platform(), "processor": platform.processor(),
+                                                     "python": platform.python_version(), "numpy": np.__version__,
+                                                     "trimesh": lazy_imports.trimesh().__version__},
+            "repeats": repeats, "results": results}
+
+
+def compare(baseline, current, tolerance=0.25, minimum_seconds=0.002):
+    """Compare the latencies of the total and of COMPARED_STAGES and the counters with a baseline. A latency is a
+    regression if it is more than tolerance (fraction) and more than minimum_seconds slower than the baseline, the
+    absolute margin keeps the timer noise of very short stages out. Return a list of messages, empty if nothing regressed"""
+    if baseline.get("version") != current.get("version"):
+        return [f'The baseline has benchmark version {baseline.get("version")} instead of {current.get("version")}']
+
+    messages = []
+    for key, result in current["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        for name in ("total",) + COMPARED_STAGES:
+            before = reference["latency_seconds"].get(name)
+            after = result["latency_seconds"].get(name)
+            if before is not None and after is not None and after > before * (1 + tolerance) and after - before > minimum_seconds:
+                messages.append(f'{key} {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms (+{(after / before - 1) * 100:.0f}%)')
+        for name in COMPARED_COUNTERS:
+            if reference["counters"].get(name) != result["counters"].get(name):
+                messages.append(f'{key} {name}: {reference["counters"].get(name)} -> {result["counters"].get(name)}')
+    return messages
+
+
+def main(arguments=None):
+    """Command line entry point of the benchmarks, exits with status 1 if a comparison finds a regression"""
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline over the mock cases")
+    parser.add_argument("--cases", type=int, nargs="+", default=[1, 2, 3], help="Mock cases to run")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per configuration, the fastest is kept")
+    parser.add_argument("--save", help="Write the results to this JSON baseline file")
+    parser.add_argument("--compare", help="Compare the results with this JSON baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown as a fraction of the baseline")
+    arguments = parser.parse_args(arguments)
+
+    current = run_benchmarks(arguments.cases, arguments.repeats)
+    if arguments.save:
+        with open(arguments.save, "w") as file:
+            json.dump(current, file, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        messages = compare(baseline, current, arguments.tolerance)
+        for message in messages:
+            print(message)
+        if messages:
+            sys.exit(1)
+        print("No regressions compared to the baseline")
+
+
+if __name__ == "__main__":
+    main()
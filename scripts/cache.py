@@ -0,0 +1,194 @@
+"""
+Slice cache
+===========
+
+Content addressed on-disk cache of the mesh slicing and contour creation. The key is a hash of the content of the object
+meshes, of the centerline points and normals and of the sliced plane numbers, so changing a mesh or the centerline gives a
+new entry. The plane numbers should not depend on vessel_wall: main.py caches all planes that cut the tumor and selects the
+planes near the vessel afterwards, so changing vessel_wall, minimum_degrees or per_degree reuses the cached planes. Every
+entry is a single .npz file with the intersection segments and the contour points packed as flat coordinate arrays with
+offsets. The least recently used entries are removed when the directory grows beyond max_bytes.
+"""
+
+#Import packages
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+#Import modules
+from scripts.plane_intersections import intersection_planes_with_objects
+from scripts.contour_creation import create_contour_from_intersection_points
+from scripts import lazy_imports
+
+
+#Increase when the packed format or the slicing and contour creation change, so old entries are not used anymore
+CACHE_VERSION = 1
+
+
+def mesh_hash(mesh):
+    """Hash of the vertices and faces of a mesh"""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(mesh.vertices, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(mesh.faces, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(object_meshes, centerline_points, normal_points, plane_indices=None, reference_vectors=None):
+    """Key of the slicing and contours of the object meshes for the planes given by the centerline points and normals,
+    or only the planes with the given plane numbers, and the reference vectors of the contours"""
+    digest = hashlib.sha256(f"version{CACHE_VERSION}".encode())
+    for object_mesh in object_meshes:
+        digest.update(object_mesh.encode())
+        digest.update(mesh_hash(object_meshes[object_mesh]).encode())
+    digest.update(np.ascontiguousarray(centerline_points, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(normal_points, dtype=np.float64).tobytes())
+    if plane_indices is not None:
+        digest.update(b"planes")
+        digest.update(np.ascontiguousarray(plane_indices, dtype=np.int64).tobytes())
+    if reference_vectors is not None:
+        digest.update(b"reference_vectors")
+        digest.update(np.ascontiguousarray(reference_vectors, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def pack_planes(intersections_with_planes, all_contours, object_meshes):
+    """Pack the intersection segments and contours of every plane per object mesh in flat arrays with offsets.
+    The entry of plane row p and object mesh o is number p * objects + o"""
+    plane_indices = [int(plane.split("plane")[1]) for plane in intersections_with_planes]
+    segments, segment_counts = [], []
+    points, chain_lengths, chain_counts = [], [], []
+
+    for plane in intersections_with_planes:
+        for object_mesh in object_meshes:
+            plane_segments = np.asarray(intersections_with_planes[plane][object_mesh], dtype=np.float64).reshape(-1, 2, 3)
+            segments.append(plane_segments)
+            segment_counts.append(len(plane_segments))
+
+            chains = [np.asarray(line.coords) for line in all_contours[plane][object_mesh].geoms]
+            points.extend(chains)
+            chain_lengths.extend(len(chain) for chain in chains)
+            chain_counts.append(len(chains))
+
+    return {
+        "plane_indices": np.array(plane_indices, dtype=np.int64),
+        "object_meshes": np.array(list(object_meshes), dtype=str),
+        "segments": np.concatenate([np.zeros((0, 2, 3))] + segments),
+        "segment_offsets": np.concatenate([[0], np.cumsum(segment_counts, dtype=np.int64)]),
+        "points": np.concatenate([np.zeros((0, 2))] + points),
+        "point_offsets": np.concatenate([[0], np.cumsum(chain_lengths, dtype=np.int64)]),
+        "chain_offsets": np.concatenate([[0], np.cumsum(chain_counts, dtype=np.int64)]),
+    }
+
+
+def unpack_planes(packed):
+    """Rebuild the intersection and contour dictionaries from packed arrays"""
+    shapely = lazy_imports.shapely()
+    object_meshes = packed["object_meshes"].tolist()
+    segments, segment_offsets = packed["segments"], packed["segment_offsets"]
+    points, point_offsets, chain_offsets = packed["points"], packed["point_offsets"], packed["chain_offsets"]
+
+    intersections_with_planes = {}
+    all_contours = {}
+    entry = 0
+    for plane_index in packed["plane_indices"].tolist():
+        plane = f'plane{plane_index}'
+        intersections_with_planes[plane] = {}
+        all_contours[plane] = {}
+        for object_mesh in object_meshes:
+            intersections_with_planes[plane][object_mesh] = segments[segment_offsets[entry]:segment_offsets[entry + 1]]
+            chains = range(chain_offsets[entry], chain_offsets[entry + 1])
+            all_contours[plane][object_mesh] = shapely.MultiLineString([shapely.LineString(points[point_offsets[chain]:point_offsets[chain + 1]])
+                                                                for chain in chains])
+            entry += 1
+
+    return intersections_with_planes, all_contours
+
+
+class SliceCache:
+    """Directory of packed .npz entries with least recently used eviction, the modification time marks the last use"""
+
+    def __init__(self, directory, max_bytes=1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """File of a cache entry"""
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        """Return the arrays of an entry or None if it is not cached, reading an entry marks it as recently used"""
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            #A truncated or corrupt entry counts as a miss and is removed
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return arrays
+
+    def put(self, key, arrays):
+        """Store the arrays of an entry and remove the least recently used entries if the cache is too large"""
+        #Write to a temporary file first so concurrent readers never see a partial entry, its suffix keeps it out of evict
+        handle, temporary_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(handle, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temporary_path, self.path(key))
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the total size is at most max_bytes, the entry keep is never removed"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                status = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                #Removed by another process in the meantime
+                continue
+            entries.append((status.st_mtime, status.st_size, name))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if name == f"{keep}.npz":
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
+def cached_planes(cache, object_meshes, centerline_points, normal_points, face_indices=None, plane_indices=None, reference_vectors=None):
+    """Return the intersections and contours of every plane (or of the given plane numbers) from the cache, slice the
+    meshes and create the contours only if they are not cached yet"""
+    key = cache_key(object_meshes, centerline_points, normal_points, plane_indices, reference_vectors)
+    packed = cache.get(key)
+    if packed is not None:
+        return unpack_planes(packed)
+
+    if plane_indices is None:
+        intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points, normal_points, face_indices)
+    else:
+        intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                     face_indices, plane_indices)
+    all_contours = create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                           reference_vectors)
+    cache.put(key, pack_planes(intersections_with_planes, all_contours, object_meshes))
+    return intersections_with_planes, all_contours
@@ -0,0 +1,186 @@
+"""
+Centerline
+==========
+
+Smooth centerline of a vessel as a natural cubic spline through centerline points, parametrized by chord length.
+A lookup table with a constant arc length spacing maps an arc length to the spline parameter in constant time, so the
+centerline can be evaluated at any arc length, resampled at a constant slice thickness and the contact length is the
+difference of the arc lengths of the first and last plane instead of a sum of chords between the planes.
+Rotation-minimizing frames (double reflection method) give every plane an in-plane reference direction that does not
+twist along the vessel.
+"""
+
+#Import packages
+import numpy as np
+
+
+#Gauss-Legendre nodes and weights on [0, 1] used to integrate the speed of the spline
+_GAUSS_NODES, _GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(5)
+_GAUSS_NODES = (_GAUSS_NODES + 1) / 2
+_GAUSS_WEIGHTS = _GAUSS_WEIGHTS / 2
+
+
+def natural_cubic_spline(knots, values):
+    """Second derivatives of the natural cubic spline through values (n, dimensions) at the knots, solved with the
+    tridiagonal (Thomas) algorithm"""
+    number_of_knots = len(knots)
+    second_derivatives = np.zeros_like(values)
+    if number_of_knots < 3:
+        return second_derivatives
+
+    h = np.diff(knots)
+    slopes = np.diff(values, axis=0) / h[:, np.newaxis]
+    lower = h[:-1].copy()
+    diagonal = 2 * (h[:-1] + h[1:])
+    upper = h[1:].copy()
+    right_hand_side = 6 * np.diff(slopes, axis=0)
+
+    #Forward elimination and back substitution for the interior knots
+    for i in range(1, number_of_knots - 2):
+        factor = lower[i] / diagonal[i - 1]
+        diagonal[i] -= factor * upper[i - 1]
+        right_hand_side[i] -= factor * right_hand_side[i - 1]
+    interior = np.zeros_like(right_hand_side)
+    interior[-1] = right_hand_side[-1] / diagonal[-1]
+    for i in range(number_of_knots - 4, -1, -1):
+        interior[i] = (right_hand_side[i] - upper[i] * interior[i + 1]) / diagonal[i]
+
+    second_derivatives[1:-1] = interior
+    return second_derivatives
+
+
+class Centerline:
+    """
+    Natural cubic spline through centerline points with an arc length lookup table.
+    arc_lengths holds the arc length of every input point, length the total arc length in mm.
+    """
+
+    def __init__(self, points, table_spacing=None, subdivisions=8):
+        """Fit the spline through the points (n, 3), consecutive duplicate points are removed.
+        table_spacing is the arc length spacing of the lookup table, by default a quarter of the shortest segment"""
+        points = np.asarray(points, dtype=np.float64)
+        keep = np.concatenate([[True], np.linalg.norm(np.diff(points, axis=0), axis=1) > 0])
+        self.points = points[keep]
+        if len(self.points) < 2:
+            raise ValueError("A centerline needs at least two distinct points")
+
+        #Chord length parametrization and spline coefficients per segment
+        self.knots = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(self.points, axis=0), axis=1))])
+        self.second_derivatives = natural_cubic_spline(self.knots, self.points)
+
+        #Arc length at the ends of subdivisions of every segment, integrated with Gauss-Legendre quadrature
+        parameters = np.interp(np.arange((len(self.knots) - 1) * subdivisions + 1) / subdivisions,
+                               np.arange(len(self.knots)), self.knots)
+        widths = np.diff(parameters)
+        speeds = np.linalg.norm(self.derivative(parameters[:-1, np.newaxis] + widths[:, np.newaxis] * _GAUSS_NODES), axis=-1)
+        parameter_arc_lengths = np.concatenate([[0], np.cumsum(widths * (speeds @ _GAUSS_WEIGHTS))])
+        self.length = parameter_arc_lengths[-1]
+        self.arc_lengths = np.full(len(points), np.nan)
+        self.arc_lengths[keep] = parameter_arc_lengths[::subdivisions]
+        self.arc_lengths = np.maximum.accumulate(np.nan_to_num(self.arc_lengths, nan=0.0))
+
+        #Lookup table of the spline parameter and its segment at a constant arc length spacing. With a spacing smaller
+        #than the shortest segment a table cell contains at most one knot, so the segment is found in constant time
+        if table_spacing is None:
+            table_spacing = max(np.diff(parameter_arc_lengths[::subdivisions]).min() / 4, self.length / 1e6)
+        number_of_cells = int(np.ceil(self.length / table_spacing))
+        self.table_spacing = self.length / number_of_cells
+        self.table_parameters = np.interp(np.arange(number_of_cells + 1) * self.table_spacing, parameter_arc_lengths, parameters)
+        self.table_segments = np.clip(np.searchsorted(self.knots, self.table_parameters, side="right") - 1, 0, len(self.knots) - 2)
+
+    def _segments(self, parameters):
+        """Segment of every parameter, by search in the knots"""
+        return np.clip(np.searchsorted(self.knots, parameters, side="right") - 1, 0, len(self.knots) - 2)
+
+    def _evaluate(self, parameters, segments, order):
+        """Evaluate the spline (order 0) or its derivative (order 1) at parameters in the given segments"""
+        h = self.knots[segments + 1] - self.knots[segments]
+        t = (parameters - self.knots[segments])[..., np.newaxis]
+        h = h[..., np.newaxis]
+        start, end = self.points[segments], self.points[segments + 1]
+        m_start, m_end = self.second_derivatives[segments], self.second_derivatives[segments + 1]
+        b = (end - start) / h - h * (2 * m_start + m_end) / 6
+        c = m_start / 2
+        d = (m_end - m_start) / (6 * h)
+        if order == 0:
+            return start + t * (b + t * (c + t * d))
+        return b + t * (2 * c + 3 * t * d)
+
+    def derivative(self, parameters):
+        """Derivative of the spline with respect to its parameter"""
+        parameters = np.asarray(parameters, dtype=np.float64)
+        return self._evaluate(parameters, self._segments(parameters), order=1)
+
+    def parameters_at(self, arc_lengths):
+        """Spline parameter and segment at the given arc lengths in constant time with the lookup table"""
+        arc_lengths = np.clip(np.asarray(arc_lengths, dtype=np.float64), 0, self.length)
+        position = arc_lengths / self.table_spacing
+        cells = np.minimum(position.astype(np.int64), len(self.table_parameters) - 2)
+        fraction = position - cells
+        parameters = self.table_parameters[cells] + fraction * (self.table_parameters[cells + 1] - self.table_parameters[cells])
+
+        #The parameter is at most one knot beyond the segment at the start of its cell
+        segments = self.table_segments[cells]
+        segments = np.minimum(segments + (parameters >= self.knots[np.minimum(segments + 1, len(self.knots) - 1)]), len(self.knots) - 2)
+        return parameters, segments
+
+    def points_at(self, arc_lengths):
+        """Points on the centerline at the given arc lengths"""
+        parameters, segments = self.parameters_at(arc_lengths)
+        return self._evaluate(parameters, segments, order=0)
+
+    def tangents_at(self, arc_lengths):
+        """Unit tangents of the centerline at the given arc lengths"""
+        parameters, segments = self.parameters_at(arc_lengths)
+        tangents = self._evaluate(parameters, segments, order=1)
+        return tangents / np.linalg.norm(tangents, axis=-1, keepdims=True)
+
+    def resample(self, slice_thickness=None, number_of_slices=None):
+        """Arc lengths at a constant slice thickness from the start, or of number_of_slices evenly spaced planes including
+        both ends. Return the arc lengths, the centerline points and the normals (unit tangents) of the planes"""
+        if number_of_slices is None:
+            arc_lengths = np.arange(0, self.length + 1e-9, slice_thickness)
+        else:
+            arc_lengths = np.linspace(0, self.length, number_of_slices)
+        return arc_lengths, self.points_at(arc_lengths), self.tangents_at(arc_lengths)
+
+    def frames(self, arc_lengths, reference_vector=None):
+        """Rotation-minimizing frames at increasing arc lengths with the double reflection method.
+        The first reference direction is reference_vector projected on the first plane (by default the axis least
+        aligned with the tangent). Return the tangents and the two in-plane unit vectors (reference, tangent x reference)"""
+        points = self.points_at(arc_lengths)
+        tangents = self.tangents_at(arc_lengths)
+
+        if reference_vector is None:
+            reference_vector = np.eye(3)[np.argmin(np.abs(tangents[0]))]
+        reference = reference_vector - (reference_vector @ tangents[0]) * tangents[0]
+        if np.linalg.norm(reference) == 0:
+            raise ValueError("The reference vector is parallel to the tangent of the centerline")
+
+        references = np.zeros_like(tangents)
+        references[0] = reference / np.linalg.norm(reference)
+        for i in range(len(points) - 1):
+            #Reflect the frame in the plane bisecting the two points, then in the plane bisecting the tangents
+            v1 = points[i + 1] - points[i]
+            c1 = v1 @ v1
+            if c1 == 0:
+                references[i + 1] = references[i]
+                continue
+            reference_left = references[i] - (2 / c1) * (v1 @ references[i]) * v1
+            tangent_left = tangents[i] - (2 / c1) * (v1 @ tangents[i]) * v1
+            v2 = tangents[i + 1] - tangent_left
+            c2 = v2 @ v2
+            references[i + 1] = reference_left if c2 == 0 else reference_left - (2 / c2) * (v2 @ reference_left) * v2
+
+        references /= np.linalg.norm(references, axis=1)[:, np.newaxis]
+        return tangents, references, np.cross(tangents, references)
+
+    def planes(self, number_of_slices=None, slice_thickness=None, reference_vector=None):
+        """Planes of the slicing: number_of_slices evenly spaced planes (by default as many as there are centerline points)
+        or planes at a constant slice_thickness, with rotation-minimizing frames so the in-plane x axis does not twist
+        between the planes. Return the arc lengths, the centerline points, the normals and the reference vectors"""
+        if number_of_slices is None and slice_thickness is None:
+            number_of_slices = len(self.arc_lengths)
+        arc_lengths, centerline_points, normal_points = self.resample(slice_thickness, number_of_slices)
+        _, reference_vectors, _ = self.frames(arc_lengths, reference_vector)
+        return arc_lengths, centerline_points, normal_points, reference_vectors
@@ -0,0 +1,120 @@
+"""
+Centerline extraction
+=====================
+
+Extract the centerline of a vessel mesh by iterative slicing and centroid tracking. The first planes are perpendicular to
+the principal axis of the vertices, every iteration slices the vessel again perpendicular to the tangent of the previous
+centerline and moves the centerline points to the centroids of the cross-sections. Only the faces cut by a plane are
+visited (face index), so the extraction scales with the size of the cross-sections instead of the size of the mesh.
+"""
+
+#Import packages
+import numpy as np
+
+#Import modules
+from scripts.plane_intersections import iter_intersection_planes_with_object
+from scripts.contour_creation import stitch_segments
+from scripts.spatial_index import BoundingVolumeHierarchy
+
+
+def principal_axis(vertices):
+    """Return the mean of the vertices and the unit direction of their largest variance, with its largest component positive"""
+    vertices = np.asarray(vertices, dtype=np.float64)
+    center = vertices.mean(axis=0)
+    eigenvalues, eigenvectors = np.linalg.eigh(np.cov((vertices - center).T))
+    axis = eigenvectors[:, -1]
+    if axis[np.argmax(np.abs(axis))] < 0:
+        axis = -axis
+    return center, axis
+
+
+def cross_section_centroid(segments, reference_point):
+    """Centroid, perimeter and roundness (smallest over largest distance of the boundary to the centroid) of the
+    cross-section closest to reference_point from the intersection segments of one plane.
+    Every closed contour gets the length weighted centroid of its boundary. Return None if the plane misses the vessel"""
+    if len(segments) == 0:
+        return None
+
+    cross_sections = []
+    for chain in stitch_segments(segments):
+        lengths = np.linalg.norm(np.diff(chain, axis=0), axis=1)
+        middles = (chain[1:] + chain[:-1]) / 2
+        if lengths.sum() > 0:
+            centroid = (middles * lengths[:, np.newaxis]).sum(axis=0) / lengths.sum()
+            radii = np.linalg.norm(chain - centroid, axis=1)
+            cross_sections.append((centroid, lengths.sum(), radii.min() / radii.max()))
+    if not cross_sections:
+        return None
+
+    #A plane can cut the vessel more than once (e.g. a curved vessel or a branch), follow the closest cross-section
+    return min(cross_sections, key=lambda cross_section: np.linalg.norm(cross_section[0] - reference_point))
+
+
+def track_centroids(vessel_mesh, origins, normals, face_index, trim_ends=False):
+    """Slice the vessel with every plane and return the centroids of the cross-sections. Planes that miss the vessel or
+    only clip its end (a perimeter less than half the median perimeter) are left out. With trim_ends the planes are
+    perpendicular to the vessel, then cross-sections at the ends that are not round or differ in perimeter from the
+    median cut the end caps and are left out as well"""
+    cross_sections = [cross_section_centroid(segments, origin) for origin, segments
+                      in zip(origins, iter_intersection_planes_with_object(vessel_mesh, origins, normals, face_index=face_index))]
+    cross_sections = [cross_section for cross_section in cross_sections if cross_section is not None]
+    if len(cross_sections) < 2:
+        raise ValueError("The vessel mesh is cut by less than two planes, decrease the spacing")
+
+    centroids, perimeters, roundness = (np.array(values) for values in zip(*cross_sections))
+    regular = perimeters >= np.median(perimeters) / 2
+    if trim_ends:
+        #Only the ends are trimmed, irregular cross-sections in between (e.g. a stenosis) are kept
+        irregular = (np.abs(perimeters / np.median(perimeters) - 1) > 0.15) | (roundness < 0.8 * np.median(roundness))
+        first = np.argmin(irregular) if not irregular.all() else len(irregular)
+        last = len(irregular) - np.argmin(irregular[::-1])
+        regular[:first] = False
+        regular[last:] = False
+    if regular.sum() < 2:
+        raise ValueError("The vessel mesh has less than two regular cross-sections, decrease the spacing")
+    return centroids[regular]
+
+
+def resample_polyline(points, spacing=None, number_of_points=None):
+    """Resample a polyline at a constant arc length spacing from its first point, or at number_of_points evenly spaced
+    points including both ends. Return the points and the unit tangents"""
+    points = np.asarray(points, dtype=np.float64)
+    arc_lengths = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+    if number_of_points is None:
+        samples = np.arange(0, arc_lengths[-1] + 1e-9, spacing)
+    else:
+        samples = np.linspace(0, arc_lengths[-1], number_of_points)
+
+    resampled_points = np.column_stack([np.interp(samples, arc_lengths, points[:, axis]) for axis in range(points.shape[1])])
+    tangents = np.gradient(resampled_points, axis=0)
+    tangents /= np.linalg.norm(tangents, axis=1)[:, np.newaxis]
+    return resampled_points, tangents
+
+
+def extract_centerline(vessel_mesh, spacing=1.0, number_of_points=None, iterations=3, face_index=None):
+    """Extract the centerline of a vessel mesh, see the module docstring.
+    The centerline is sampled every spacing mm or, if given, at number_of_points evenly spaced points.
+    Return the centerline points and the normals (unit tangents) of the planes, like the generators in centerline_points"""
+    vertices = np.asarray(vessel_mesh.vertices, dtype=np.float64)
+    if face_index is None:
+        face_index = getattr(vessel_mesh, "face_index", None) or BoundingVolumeHierarchy.from_mesh(vessel_mesh)
+
+    #Initial planes perpendicular to the principal axis, half a step away from the ends of the vessel
+    center, axis = principal_axis(vertices)
+    projections = (vertices - center) @ axis
+    step = spacing if number_of_points is None else (projections.max() - projections.min()) / number_of_points
+    distances_along_axis = np.arange(projections.min() + step / 2, projections.max(), step)
+    origins = center + distances_along_axis[:, np.newaxis] * axis
+    normals = np.tile(axis, (len(origins), 1))
+
+    for iteration in range(iterations):
+        #Move every point to the centroid of the cross-section of its plane
+        centroids = track_centroids(vessel_mesh, origins, normals, face_index, trim_ends=iteration > 0)
+
+        #Planes of the next iteration are perpendicular to the tangent of the centroids, with one extra plane beyond
+        #both ends so the centerline grows to the ends of the vessel, planes outside the vessel miss it and are left out
+        points, tangents = resample_polyline(centroids, spacing=step)
+        origins = np.vstack([points[:1] - step * tangents[:1], points, points[-1:] + step * tangents[-1:]])
+        normals = np.vstack([tangents[:1], tangents, tangents[-1:]])
+
+    return resample_polyline(track_centroids(vessel_mesh, origins, normals, face_index, trim_ends=True), spacing, number_of_points)
@@ -1,6 +1,9 @@
 # Import packages
 import numpy as np
-from shapely.geometry import LineString, MultiLineString
+
+# Import modules
+from scripts import lazy_imports
+
 
 def get_coordinate_frame_from_normal_and_points(origin, normal, points):
     """Create coordinate basis vectors (x,y,z)"""
@@ -75,8 +78,9 @@ def transform_points_to_new_coordinate_system(points, T):
     return new_points[:,:3]
 
 
-def intersection_points_to_2d_array(intersection_points, origin, normal):
-    """ Convert the intersection points in the 3D space to the corresponding 2D points on the plane"""
+def intersection_points_to_2d_array(intersection_points, origin, normal, reference_vector=None):
+    """ Convert the intersection points in the 3D space to the corresponding 2D points on the plane.
+    The x axis of the plane follows reference_vector if given, otherwise the direction of the first intersection point"""
     # First check if the points array is not empty
     if intersection_points.shape[0] == 0:
         return np.array([])
@@ -88,7 +92,13 @@ def intersection_points_to_2d_array(intersection_points, origin, normal):
     reshaped_intersection_points = intersection_points.reshape(intersection_points.shape[0]*2, 3)
     
     # Get the coordinate system of the plane based on the origin and corresponding normal
-    B1, B2 = get_coordinate_frame_from_normal_and_points(origin, normal, reshaped_intersection_points)
+    if reference_vector is None:
+        B1, B2 = get_coordinate_frame_from_normal_and_points(origin, normal, reshaped_intersection_points)
+    else:
+        # Project the reference vector on the plane, so the angles of all planes start at the same direction
+        B1 = reference_vector - np.dot(reference_vector, normal) * normal
+        B1 = B1 / np.linalg.norm(B1)
+        B2 = np.cross(normal, B1)
     
     # Create the transformation matrix, only to plane is used to provide 2D representation
     T_to_global, T_to_plane = create_transformation_matrix(B1, B2, origin, normal)
@@ -102,8 +112,62 @@ def intersection_points_to_2d_array(intersection_points, origin, normal):
     return transformed_points
 
 
-def create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points):
-    """ Create a 2D contour from the intersection points of the object_meshes for every plane"""
+def stitch_segments(segments, decimals=8):
+    """ Stitch line segments with shape (m, 2, dimensions) into connected chains of points in a single pass.
+    Endpoints are matched with a hash on their coordinates rounded to decimals. Closed rings end with their first point.
+    Return a list of arrays with the points of every chain"""
+    segments = np.asarray(segments, dtype=np.float64)
+    
+    #Give every distinct quantized endpoint a node number
+    endpoints = segments.reshape(-1, segments.shape[-1])
+    node_of_key = {}
+    nodes = np.array([node_of_key.setdefault(key, len(node_of_key))
+                      for key in map(tuple, np.round(endpoints, decimals).tolist())], dtype=np.int64).reshape(-1, 2)
+    
+    #Coordinates of every node, taken from its first occurrence
+    node_points = np.empty((len(node_of_key), endpoints.shape[1]))
+    node_points[nodes.ravel()[::-1]] = endpoints[::-1]
+    
+    #Segments connected to every node, segments with both ends on the same node do not contribute
+    segments_of_node = [[] for _ in range(len(node_of_key))]
+    for segment, (start, end) in enumerate(nodes.tolist()):
+        if start != end:
+            segments_of_node[start].append(segment)
+            segments_of_node[end].append(segment)
+    used = nodes[:, 0] == nodes[:, 1]
+    
+    def walk(node):
+        """Follow unused segments from node, return the visited nodes"""
+        chain = []
+        while True:
+            next_segment = next((segment for segment in segments_of_node[node] if not used[segment]), None)
+            if next_segment is None:
+                return chain
+            used[next_segment] = True
+            start, end = nodes[next_segment]
+            node = end if start == node else start
+            chain.append(node)
+    
+    chains = []
+    for segment in range(len(nodes)):
+        if used[segment]:
+            continue
+        used[segment] = True
+        start, end = nodes[segment]
+        
+        #Walk forward from the end and backward from the start of the segment
+        forward = walk(end)
+        backward = walk(start) if not forward or forward[-1] != start else []
+        chain = backward[::-1] + [start, end] + forward
+        chains.append(node_points[chain])
+        
+    return chains
+
+
+def create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points, reference_vectors=None):
+    """ Create a 2D contour from the intersection points of the object_meshes for every plane.
+    reference_vectors optionally gives the x axis of every plane, e.g. the rotation-minimizing frames of a Centerline"""
+    shapely = lazy_imports.shapely()
     #Initialize dictonary per plane
     all_contours = {}
 
@@ -115,23 +179,24 @@ def create_contour_from_intersection_points(intersections_with_planes, object_me
         plane_index = plane.split("plane")[1]
         normal = normal_points[int(plane_index)]
         origin = centerline_points[int(plane_index)]
+        reference_vector = None if reference_vectors is None else reference_vectors[int(plane_index)]
         
         for object_mesh in object_meshes:
                 
             #Move points to 2D plane coordinate system
-            contour_points = intersection_points_to_2d_array(intersections_with_planes[plane][object_mesh], origin, normal)
+            contour_points = intersection_points_to_2d_array(intersections_with_planes[plane][object_mesh], origin, normal, reference_vector)
             
             #Initialize empty contour
-            contour = MultiLineString([])
+            contour = shapely.MultiLineString([])
             
             #Check if there are intersections with the object_mesh
             if contour_points.shape[0] == 0:
                 contours_per_object_mesh[object_mesh] = contour
                 continue
             
-            #Loop through the line segments and add them to the multile string
-            for i in range(0, contour_points.shape[0], 2):
-                contour = contour.union(LineString([contour_points[i], contour_points[i+1]]))
+            #Stitch the line segments into rings and add them to the multiline string
+            segments = contour_points.reshape(-1, 2, 2)
+            contour = shapely.MultiLineString([shapely.LineString(chain) for chain in stitch_segments(segments)])
                 
             #Add to dictionary
             contours_per_object_mesh[object_mesh] = contour
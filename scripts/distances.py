@@ -1,31 +1,46 @@
 #Import packages
 import numpy as np
 
+#Import modules
+from scripts.results import RayHits, DistanceMatrix
+from scripts import lazy_imports
 
-def calculate_distance(all_intersections):
-    """Calculate the distances between the tumor and vessel in mm per plane per line."""
+
+def calculate_distance(all_intersections, centroids=None):
+    """Calculate the distances between the tumor and vessel in mm per plane per line.
+    If all_intersections is a RayHits container a DistanceMatrix is returned. The intersection dictionaries of
+    line_intersections need the start points of the lines per plane with shape (planes, 2), see plane_lines"""
+    if isinstance(all_intersections, RayHits):
+        return calculate_distance_matrix(all_intersections)
+    if centroids is None:
+        raise ValueError("The centroids of the planes are needed to find the nearest intersections")
+    shapely = lazy_imports.shapely()
     
     #Initialize dictonary per plane
     all_distances = {}
     
-    for plane in all_intersections:
+    for plane, centroid in zip(all_intersections, np.asarray(centroids, dtype=np.float64)):
+        origin = shapely.Point(centroid)
         
         #Initialize dictionary per line
         distance_per_line = {}
         
         for line in all_intersections[plane]:
             
-            #Initialize list
-            points = []
-            
-            #Filter only the lines that have an intersection with the tumor
-            if 'tumor' in all_intersections[plane][line]:
-                for object_mesh in all_intersections[plane][line]:
-                    points.append(all_intersections[plane][line][object_mesh])
+            #Split the intersections of the line in tumor and vessel points
+            tumor_points = []
+            vessel_points = []
+            for object_mesh, point in all_intersections[plane][line].items():
+                if "tumor" in object_mesh:
+                    tumor_points.append(point)
+                else:
+                    vessel_points.append(point)
             
-            if len(points) >= 2:
-                distance = points[0].distance(points[1])
-                distance_per_line[line] = distance
+            #Only the lines that intersect the tumor and a vessel, the intersections closest to the centroid are used
+            if tumor_points and vessel_points:
+                tumor_point = min(tumor_points, key=lambda point: point.distance(origin))
+                vessel_point = min(vessel_points, key=lambda point: point.distance(origin))
+                distance_per_line[line] = tumor_point.distance(vessel_point)
    
             else:
                 distance_per_line[line] = np.inf #infinite value to show no intersection with the tumor
@@ -36,33 +51,67 @@ def calculate_distance(all_intersections):
     return all_distances
 
 
+def radial_gap(hit_distances, tumor_columns):
+    """Distance between the tumor and the vessel along every line from the hit distances with shape (..., lines, objects).
+    Both intersections lie on the same line from the centroid, so their distance is the difference of the hit distances.
+    tumor_columns marks the tumor objects, the nearest tumor and nearest vessel hit are used.
+    Lines that miss the tumor or the vessel get np.inf. Return an array with shape (..., lines)"""
+    #Nearest hit per group, reduced column by column since there are only a few object meshes
+    tumor_distance = np.full(hit_distances.shape[:-1], np.inf)
+    vessel_distance = np.full(hit_distances.shape[:-1], np.inf)
+    for column, tumor in enumerate(tumor_columns):
+        np.minimum(tumor_distance if tumor else vessel_distance, hit_distances[..., column], out=tumor_distance if tumor else vessel_distance)
+    
+    #inf - inf gives nan when both are missed, which is replaced by inf as well
+    with np.errstate(invalid='ignore'):
+        gaps = np.subtract(tumor_distance, vessel_distance, out=tumor_distance)
+    np.abs(gaps, out=gaps)
+    np.copyto(gaps, np.inf, where=np.isnan(gaps))
+    return gaps
+
+
+def contact_mask(gaps, vessel_wall):
+    """Boolean mask of the lines where the tumor is within vessel_wall of the vessel"""
+    return gaps <= vessel_wall
+
+
+def planes_with_contact(contact):
+    """Reduce a (planes, lines) contact mask to the planes with at least one line with contact"""
+    return contact.any(axis=-1)
+
+
+def calculate_distance_matrix(ray_hits):
+    """Calculate the distances between the tumor and vessel in mm per plane per line from the hit distances along the lines"""
+    return DistanceMatrix(ray_hits.plane_indices, ray_hits.line_angles, radial_gap(ray_hits.hit_distances, ray_hits.tumor_columns()))
+
+
 def filter_distances(all_distances, vessel_wall):
     """Filter the planes where at least on one of the lines the distance between the tumor and the vessel is smaller or equal to
-    the vessel wall thickness set in the parameters in the main file"""
+    the vessel wall thickness set in the parameters in the main file. A DistanceMatrix returns a filtered DistanceMatrix"""
+    if isinstance(all_distances, DistanceMatrix):
+        contact = contact_mask(all_distances.distances, vessel_wall)
+        rows = planes_with_contact(contact)
+        distances = all_distances.distances[rows]
+        distances[~contact[rows]] = np.inf
+        return DistanceMatrix(all_distances.plane_indices[rows], all_distances.line_angles, distances)
     
-    #Initialize dictionary
-    all_planes_filtered = {}
-    
-    #Add plane to dictionary if there is contact between the tumor and vessel at a certain point
-    for plane in all_distances:
-        for line in all_distances[plane]:
-            if all_distances[plane][line] <= vessel_wall: 
-                all_planes_filtered[plane] = all_distances[plane]
-                break
-            
     #Initialize dictionary
     all_distances_filtered = {}
-            
+    
     #Change line value in dictionary if for that line, the tumor is not close enough to the vessel to make contact
-    for plane in all_planes_filtered:
+    #and only keep the plane if there is contact between the tumor and vessel on at least one line
+    for plane in all_distances:
         #Initialize dictionary
         all_lines_filtered = {}
-        for line in all_planes_filtered[plane]:
-            if all_planes_filtered[plane][line] <= vessel_wall: 
-                all_lines_filtered[line] = all_planes_filtered[plane][line]
+        contact = False
+        for line, distance in all_distances[plane].items():
+            if distance <= vessel_wall: 
+                all_lines_filtered[line] = distance
+                contact = True
             else:
                 all_lines_filtered[line] = np.inf
                 
-        all_distances_filtered[plane] = all_lines_filtered
+        if contact:
+            all_distances_filtered[plane] = all_lines_filtered
 
-    return all_distances_filtered
\ No newline at end of file
+    return all_distances_filtered
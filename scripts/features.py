@@ -1,106 +1,169 @@
 #Import packages
 import numpy as np
 
+#Import modules
+from scripts.results import DistanceMatrix, EncasementAngles
+
 def euclidian_distance(p1, p2):
     """This function calculates the eucledian distance between two three dimensional points"""
-    return np.sqrt((p2[0] - p1[0])**2 + 
-                (p2[1] - p1[1])**2 + 
+    return np.sqrt((p2[0] - p1[0])**2 +
+                (p2[1] - p1[1])**2 +
                 (p2[2] - p1[2])**2)
 
 
-def feature_maximum_contact_length(all_distances_filtered, centerline_points):
-    """Calcute the maximum contact length between the tumor and the vessel and provide the planes which contribute to 
-    this maximum contact length"""
-    
-    # Initialize lists
-    plane_numbers = []
-   
-    for plane in all_distances_filtered:
-        if all(value == np.inf for value in all_distances_filtered[plane].values()):
-            print(f'no contact in {plane}')
-        else:
-            plane_index = int((plane.split("plane")[1]))
-            plane_numbers.append(plane_index)
+def plane_items(all_distances_filtered):
+    """Iterate over (plane, distance_per_line) pairs of a dictionary or of a stream of such pairs"""
+    if isinstance(all_distances_filtered, dict):
+        return all_distances_filtered.items()
+    return all_distances_filtered
 
-    # Count the longest consecutive range
-    longest_streak = 1
-    current_streak = 1
-    plane_numbers_current_streak = [plane_numbers[0]] #Since a range always starts at the first number
-    plane_numbers_longest_streak = [] #Since a range always starts at the first number
-
-    for i in range(1, len(plane_numbers)):
-        
-        #Check if the current number is one more then the previous
-        if plane_numbers[i] == plane_numbers[i-1] + 1: 
-            current_streak += 1
-            plane_numbers_current_streak.append(plane_numbers[i])
+
+def longest_consecutive_planes(plane_numbers):
+    """Return the longest range of consecutive plane numbers, the first range wins if ranges are equally long"""
+    plane_numbers_longest_streak = []
+    plane_numbers_current_streak = []
+
+    for plane_number in plane_numbers:
+
+        #Check if the current number is one more then the previous, otherwise start a new range
+        if plane_numbers_current_streak and plane_number == plane_numbers_current_streak[-1] + 1:
+            plane_numbers_current_streak.append(plane_number)
         else:
-            #Check if the current streak is longer than the longest streak, then replace the longest streak including plane numbers
-            if current_streak > longest_streak:
-                longest_streak = current_streak
-                plane_numbers_longest_streak = plane_numbers_current_streak.copy()
-            current_streak = 1
-            plane_numbers_longest_streak = [plane_numbers[i]]
-           
-    # Update longest streak for last consecutive range
-    if current_streak > longest_streak:
-        longest_streak = current_streak
-        plane_numbers_longest_streak = plane_numbers_current_streak.copy()
-        
-    # Select only the centerline points (origins of the planes in the global coordinate system)
-    points = []
-    for index in plane_numbers_longest_streak:
-        points.append(centerline_points[index])
-      
-    points = [tuple(arr) for arr in points] #Convert to a list of tupples to use
-    
-    # Approximate the longest distance of contact in mm using the global coordinates of the center by adding the euclidean distances betweeen the points
+            plane_numbers_current_streak = [plane_number]
+
+        #Check if the current streak is longer than the longest streak, then replace the longest streak including plane numbers
+        if len(plane_numbers_current_streak) > len(plane_numbers_longest_streak):
+            plane_numbers_longest_streak = plane_numbers_current_streak.copy()
+
+    return plane_numbers_longest_streak
+
+
+def contact_length(plane_numbers_longest_streak, centerline_points, arc_lengths=None):
+    """Approximate the contact length in mm by adding the euclidean distances between the centerline points (origins of
+    the planes in the global coordinate system) of the given planes. If the arc_lengths of the planes along the
+    centerline are given (see scripts.centerline.Centerline) the contact length is the exact arc length difference"""
+    if arc_lengths is not None:
+        if not plane_numbers_longest_streak:
+            return 0
+        return arc_lengths[plane_numbers_longest_streak[-1]] - arc_lengths[plane_numbers_longest_streak[0]]
+
+    points = [tuple(centerline_points[index]) for index in plane_numbers_longest_streak]
+
     maximum_contact_length = 0
-    
     for i in range(len(points) - 1):
         maximum_contact_length += euclidian_distance(points[i], points[i+1])
 
+    return maximum_contact_length
+
+
+def feature_maximum_contact_length(all_distances_filtered, centerline_points, arc_lengths=None):
+    """Calcute the maximum contact length between the tumor and the vessel and provide the planes which contribute to
+    this maximum contact length. all_distances_filtered is a dictionary or a stream of (plane, distance_per_line) pairs.
+    arc_lengths optionally provides the arc length of every plane along the centerline"""
+
+    # Initialize lists
+    plane_numbers = []
+
+    if isinstance(all_distances_filtered, DistanceMatrix):
+        #Integer plane numbers of the rows with at least one line with contact
+        contact = np.isfinite(all_distances_filtered.distances).any(axis=1)
+        plane_numbers = all_distances_filtered.plane_indices[contact].tolist()
+    else:
+        for plane, distance_per_line in plane_items(all_distances_filtered):
+            if all(value == np.inf for value in distance_per_line.values()):
+                print(f'no contact in {plane}')
+            else:
+                plane_index = int((plane.split("plane")[1]))
+                plane_numbers.append(plane_index)
+
+    # Count the longest consecutive range
+    plane_numbers_longest_streak = longest_consecutive_planes(plane_numbers)
+
+    # Approximate the longest distance of contact in mm using the global coordinates of the center
+    maximum_contact_length = contact_length(plane_numbers_longest_streak, centerline_points, arc_lengths)
+
     return maximum_contact_length, plane_numbers_longest_streak
 
 
+def lines_to_degrees(number_of_lines, per_degree):
+    """Convert a number of consecutive lines to degrees, rounded to avoid floating point noise for float per_degree"""
+    angle_degree = number_of_lines * per_degree
+    if isinstance(angle_degree, float):
+        angle_degree = round(angle_degree, 6)
+    return angle_degree
+
+
+def contact_runs(contact, circular=True):
+    """Run-length encode a (planes, lines) boolean contact mask in one vectorized pass.
+    With circular=True a run that crosses the last line to the first line is joined into one run, its last line is then
+    smaller than its first line. Return the row, first line, last line and number of lines of every run, ordered by row"""
+    contact = np.atleast_2d(np.asarray(contact, dtype=bool))
+    number_of_lines = contact.shape[1]
+
+    #Runs of consecutive lines with contact start where the padded contact mask rises and end where it falls
+    padded = np.zeros((contact.shape[0], number_of_lines + 2), dtype=np.int8)
+    padded[:, 1:-1] = contact
+    changes = np.diff(padded, axis=1)
+    rows, first_lines = np.nonzero(changes == 1)
+    last_lines = np.nonzero(changes == -1)[1] - 1
+    lengths = last_lines - first_lines + 1
+
+    if circular and number_of_lines:
+        #Planes with contact on both the first and the last line (but not on all lines) have exactly one run starting at
+        #the first line and one ending at the last line, the first is appended to the last
+        wrapping = contact[:, 0] & contact[:, -1] & ~contact.all(axis=1)
+        head = wrapping[rows] & (first_lines == 0)
+        tail = wrapping[rows] & (last_lines == number_of_lines - 1)
+        lengths[tail] += lengths[head]
+        last_lines[tail] = last_lines[head]
+        keep = ~head
+        rows, first_lines, last_lines, lengths = rows[keep], first_lines[keep], last_lines[keep], lengths[keep]
+
+    return rows, first_lines, last_lines, lengths
+
+
+def plane_angles(distance_per_line, per_degree, minimum_degrees):
+    """Calculate the angles of a single plane that are at least minimum_degrees and the lines between which they are created"""
+
+    #Initialize dictionary to registrate per angle
+    angle_dict = {}
+
+    lines = list(distance_per_line)
+    contact = np.array([distance < np.inf for distance in distance_per_line.values()], dtype=bool)
+    rows, first_lines, last_lines, lengths = contact_runs(contact)
+
+    for first_line, last_line, length in zip(first_lines.tolist(), last_lines.tolist(), lengths.tolist()):
+        angle_degree = lines_to_degrees(length, per_degree)
+        if angle_degree >= minimum_degrees:
+            angle_dict[f'Angle_{angle_degree}_degrees'] = [lines[first_line], lines[last_line]]
+
+    return angle_dict
+
+
+def feature_angles_matrix(distance_matrix, per_degree, minimum_degrees):
+    """Calculate the angles of encasement of every plane of a DistanceMatrix, return an EncasementAngles container"""
+    rows, first_lines, last_lines, lengths = contact_runs(np.isfinite(distance_matrix.distances))
+
+    #Convert the number of lines to degrees, rounded to avoid floating point noise for float per_degree
+    angles = np.round(lengths * per_degree, 6)
+    keep = angles >= minimum_degrees
+
+    return EncasementAngles(distance_matrix.plane_indices[rows[keep]], angles[keep], first_lines[keep], last_lines[keep])
+
+
 def feature_angles(all_distances_filtered, per_degree, minimum_degrees):
-    """Calculate the maximum angle for a given plane and safe the lines between which this angle is created"""
-    
+    """Calculate the maximum angle for a given plane and safe the lines between which this angle is created.
+    all_distances_filtered is a dictionary or a stream of (plane, distance_per_line) pairs.
+    A DistanceMatrix returns an EncasementAngles container"""
+    if isinstance(all_distances_filtered, DistanceMatrix):
+        return feature_angles_matrix(all_distances_filtered, per_degree, minimum_degrees)
+
     #Initialize dictionary
     all_angles = {}
-     
-    for plane in all_distances_filtered:
-        
-        #Initialize dictionary and list to registrate per angle
-        angle_dict = {}
-        line_list = []
-        
-        #Initialize angle
-        angle_degree = 0
-        
-        for line in all_distances_filtered[plane]:
-            
-            #Check if the distance between the tumor and the vessel is close enough to contribute to the angle
-            if all_distances_filtered[plane][line] < np.inf:
-                
-                #If close enough, add that line to the total angle
-                angle_degree += per_degree
-                line_list.append(line)
-                
-            #If not close enough, close angle and check if it is larger than the set minimum degrees of interest
-            else:
-                if angle_degree >= minimum_degrees:
-                    if line_list:
-                        angle_dict[f'Angle_{angle_degree}_degrees'] = [line_list[0], line_list[-1]]  #Note that due to the counting of python you do not have to substract the first line
-                
-                angle_degree = 0
-                line_list = []
-        
-        if angle_degree >= minimum_degrees:
-            if line_list:
-                angle_dict[f'Angle_{angle_degree}_degrees'] = [line_list[0], line_list[-1]]
-                
+
+    for plane, distance_per_line in plane_items(all_distances_filtered):
+        angle_dict = plane_angles(distance_per_line, per_degree, minimum_degrees)
         if angle_dict:
             all_angles[plane] = angle_dict
-            
-    return all_angles
\ No newline at end of file
+
+    return all_angles
@@ -0,0 +1,27 @@
+"""
+Lazy imports
+============
+
+trimesh and shapely take most of the import time of the pipeline, so the modules import them on first use with
+
+    shapely = lazy_imports.shapely()
+
+instead of at module level. Importing scripts.batch or main then only pays for numpy (see scripts.startup).
+"""
+
+#Import packages
+import functools
+
+
+@functools.cache
+def trimesh():
+    """Import trimesh on first use"""
+    import trimesh
+    return trimesh
+
+
+@functools.cache
+def shapely():
+    """Import shapely on first use"""
+    import shapely
+    return shapely
@@ -1,6 +1,10 @@
 #Import packages
 import numpy as np
-from shapely.geometry import LineString, Point
+
+#Import modules
+from scripts.results import RayHits
+from scripts import lazy_imports, profiling
+
 
 def filter_planes(all_contours):
     """Filter out all planes that have no tumor contact"""
@@ -14,64 +18,319 @@ def filter_planes(all_contours):
                     all_contours_filtered[plane] = all_contours[plane]
                     
     return all_contours_filtered
-                    
-def create_lines(per_degree):
-    "Compute lines within 360 degrees per degree starting in the centroid of the vessel"
-    # Parameters
-    line_length = 10  # Length of each line segment in mm, this should be enough to reach the first intersection with the vessel and tumor
-
-    # Arrays to store the x and y coordinates of the line endpoints
-    x_start = []
-    y_start = []
-    x_end = []
-    y_end = []
-
-    # Generate lines every 1 degree around the centroid
-    for angle in range(0, 360, per_degree):
+
+
+def line_angles(per_degree):
+    """Compute the angles in degrees of the lines within 360 degrees, per_degree may be any positive float that divides
+    360 (e.g. 0.25), so the gap between the last and the first line equals per_degree as well"""
+    #Count the lines without accumulating floating point steps
+    number_of_lines = int(round(360 / per_degree)) if per_degree > 0 else 0
+    if number_of_lines < 1 or not np.isclose(number_of_lines * per_degree, 360):
+        raise ValueError("per_degree has to divide 360 degrees")
+    return np.arange(number_of_lines) * per_degree
+
+
+def create_lines(per_degree, centroid=(0, 0), line_length=10):
+    "Compute lines within 360 degrees per degree starting in the centroid of the vessel, with length line_length in mm"
+    shapely = lazy_imports.shapely()
+    
+    #Endpoints of all lines at once
+    end_points = np.asarray(centroid, dtype=np.float64) + line_length * create_ray_directions(per_degree)
+    
+    #Create linestring objects
+    return [shapely.LineString([centroid, end_point]) for end_point in end_points]
+    
+
+def create_ray_directions(per_degree):
+    """Compute the unit direction vectors of the lines of create_lines, shape (lines, 2)"""
+    theta = np.deg2rad(line_angles(per_degree))
+    return np.column_stack([np.cos(theta), np.sin(theta)])
+
+
+def vessel_centroids(all_contours_filtered):
+    """Compute the centroid of the vessel contour and the extent of all contours around it for every plane in one pass.
+    The centroid is the area weighted centroid of the closed vessel rings, or the mean of the vessel points if the rings
+    enclose no area, and (0, 0) if the plane has no vessel contour. The extent is the largest distance from the centroid
+    to a point of any contour, so lines of this length reach every contour of the plane.
+    Return the centroids with shape (planes, 2) and the extents with shape (planes,)"""
+    shapely = lazy_imports.shapely()
+    number_of_planes = len(all_contours_filtered)
+    parts, part_planes, part_vessels = [], [], []
+    for plane_number, contours in enumerate(all_contours_filtered.values()):
+        for object_mesh, contour in contours.items():
+            contour_parts = shapely.get_parts(contour)
+            parts.extend(contour_parts)
+            part_planes.extend([plane_number] * len(contour_parts))
+            part_vessels.extend(["tumor" not in object_mesh] * len(contour_parts))
+    if not parts:
+        return np.zeros((number_of_planes, 2)), np.zeros(number_of_planes)
+    part_planes = np.array(part_planes, dtype=np.int64)
+    part_vessels = np.array(part_vessels, dtype=bool)
+    
+    coordinates, part_index = shapely.get_coordinates(parts, return_index=True)
+    point_planes = part_planes[part_index]
+    vessel_points = part_vessels[part_index]
+    
+    #Every point is connected to the next point of its part, the last point to the first so every ring is closed
+    next_index = np.arange(1, len(coordinates) + 1)
+    part_end = np.concatenate([part_index[1:] != part_index[:-1], [True]])
+    part_start = np.concatenate([[0], np.nonzero(part_end)[0][:-1] + 1])
+    next_index[part_end] = part_start
+    x, y = coordinates[:, 0], coordinates[:, 1]
+    x_next, y_next = x[next_index], y[next_index]
+    
+    #Shoelace formula per ring, rings are weighted by their absolute area so their orientation does not matter
+    cross = np.where(vessel_points, x * y_next - x_next * y, 0)
+    number_of_parts = len(parts)
+    ring_area = np.bincount(part_index, cross, number_of_parts)
+    ring_x = np.bincount(part_index, (x + x_next) * cross, number_of_parts)
+    ring_y = np.bincount(part_index, (y + y_next) * cross, number_of_parts)
+    weight = np.abs(ring_area)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ring_centroids = np.column_stack([ring_x, ring_y]) / (3 * ring_area[:, np.newaxis])
+    ring_centroids[weight == 0] = 0
+    plane_weight = np.bincount(part_planes, weight, number_of_planes)
+    area_centroids = np.column_stack([np.bincount(part_planes, weight * ring_centroids[:, 0], number_of_planes),
+                                      np.bincount(part_planes, weight * ring_centroids[:, 1], number_of_planes)])
+    
+    #Mean of the vessel points for the planes without enclosed area
+    vessel_counts = np.bincount(point_planes[vessel_points], minlength=number_of_planes)
+    mean_centroids = np.column_stack([np.bincount(point_planes[vessel_points], x[vessel_points], number_of_planes),
+                                      np.bincount(point_planes[vessel_points], y[vessel_points], number_of_planes)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroids = np.where((plane_weight > 0)[:, np.newaxis], area_centroids / plane_weight[:, np.newaxis],
+                             mean_centroids / vessel_counts[:, np.newaxis])
+    centroids[(plane_weight == 0) & (vessel_counts == 0)] = 0
+    
+    #Largest distance from the centroid to any contour point of the plane
+    extents = np.zeros(number_of_planes)
+    np.maximum.at(extents, point_planes, np.linalg.norm(coordinates - centroids[point_planes], axis=1))
+    return centroids, extents
+
+
+def contour_segments(contour):
+    """Convert a (Multi)LineString contour to an array of line segments with shape (segments, 2, 2)"""
+    shapely = lazy_imports.shapely()
+    if contour.is_empty:
+        return np.zeros((0, 2, 2))
+    
+    #Coordinates of all parts with the index of the part they belong to
+    coordinates, part_index = shapely.get_coordinates(shapely.get_parts(contour), return_index=True)
+    
+    #Consecutive coordinates of the same part form a segment
+    same_part = part_index[:-1] == part_index[1:]
+    return np.stack([coordinates[:-1][same_part], coordinates[1:][same_part]], axis=1)
+
+
+def ray_segment_distances(ray_directions, segments, line_length=np.inf, rays_per_chunk=512):
+    """Compute for every ray from the origin the distance to the nearest intersection with the segments within line_length.
+    Rays without an intersection get the value np.inf. Return an array with shape (rays,)"""
+    nearest = np.full(len(ray_directions), np.inf)
+    profiling.count("rays", len(ray_directions))
+    if len(segments) == 0:
+        return nearest
+    
+    #Segment start points a and edge vectors e, a point on a segment is a + u*e with 0 <= u <= 1
+    a = segments[:, 0]
+    e = segments[:, 1] - segments[:, 0]
+    a_cross_e = a[:, 0] * e[:, 1] - a[:, 1] * e[:, 0]
+    
+    #Work on chunks of rays to limit the memory of the (rays, segments) arrays
+    for start in range(0, len(ray_directions), rays_per_chunk):
+        d = ray_directions[start:start + rays_per_chunk, np.newaxis, :]
         
-        # Convert angle to radians
-        theta = np.deg2rad(angle)
+        #Solve t*d = a + u*e with 2D cross products, parallel segments never count as an intersection
+        d_cross_e = d[..., 0] * e[:, 1] - d[..., 1] * e[:, 0]
+        a_cross_d = a[:, 0] * d[..., 1] - a[:, 1] * d[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = a_cross_e / d_cross_e
+            u = a_cross_d / d_cross_e
+        hit = (d_cross_e != 0) & (u >= 0) & (u <= 1) & (t >= 0) & (t <= line_length)
         
-        # Calculate endpoint of the line segment
-        x_endpoint = line_length * np.cos(theta)
-        y_endpoint = line_length * np.sin(theta)
+        nearest[start:start + rays_per_chunk] = np.where(hit, t, np.inf).min(axis=1)
+    
+    profiling.count("hits", np.count_nonzero(nearest < np.inf))
+    return nearest
+
+
+def ray_intersection_distances(all_contours_filtered, per_degree, centroids=None, line_lengths=None):
+    """Compute for every plane, every line and every object mesh the distance from the centroid of the vessel to the
+    nearest intersection with the contour as one batch per plane. Lines without intersection get the value np.inf.
+    centroids and line_lengths per plane default to those of vessel_centroids.
+    Return an array with shape (planes, lines, objects), ordered as the planes and object meshes in all_contours_filtered"""
+    ray_directions = create_ray_directions(per_degree)
+    if centroids is None:
+        centroids, line_lengths = plane_lines(all_contours_filtered)
+    
+    hit_distances = []
+    for plane, centroid, line_length in zip(all_contours_filtered, centroids, line_lengths):
+        #Move the contours so the lines of the plane start in the origin
+        plane_distances = [ray_segment_distances(ray_directions, contour_segments(contour) - centroid, line_length)
+                           for contour in all_contours_filtered[plane].values()]
+        hit_distances.append(np.stack(plane_distances, axis=1))
         
-        # Store the coordinates
-        x_start.append(0) #Since the centroid is always in at 0,0 due to the defenition of the planes coordinate system
-        y_start.append(0) #Since the centroid is always in at 0,0 due to the defenition of the planes coordinate system
-        x_end.append(x_endpoint)
-        y_end.append(y_endpoint)
+    if not hit_distances:
+        return np.zeros((0, len(ray_directions), 0))
+    return np.stack(hit_distances)
+
+
+def plane_lines(all_contours_filtered, margin=1.01):
+    """Start point and length of the lines of every plane: the centroid of the vessel contour and the extent of the
+    contours around it times margin. Return arrays with shape (planes, 2) and (planes,)"""
+    centroids, extents = vessel_centroids(all_contours_filtered)
+    return centroids, extents * margin
+
+
+def line_hit_distances(all_contours_filtered, per_degree, angular_resolution=None, vessel_wall=None):
+    """Compute the nearest intersection distance of every line with every object mesh for every plane, optionally with
+    the adaptive refinement to angular_resolution (see adaptive_ray_intersection_distances).
+    Return a RayHits container with integer plane numbers instead of the nested dictionaries of line_intersections"""
+    centroids, line_lengths = plane_lines(all_contours_filtered)
+    if angular_resolution is None:
+        hit_distances = ray_intersection_distances(all_contours_filtered, per_degree, centroids, line_lengths)
+        angles = line_angles(per_degree)
+    else:
+        hit_distances = adaptive_ray_intersection_distances(all_contours_filtered, per_degree, angular_resolution, vessel_wall,
+                                                            centroids, line_lengths)
+        angles = line_angles(angular_resolution)
     
-    #Initialize empty list for LineString objects
-    lines=[]
+    plane_indices = [int(plane.split("plane")[1]) for plane in all_contours_filtered]
+    object_meshes = list(next(iter(all_contours_filtered.values()), {}))
+    return RayHits(plane_indices, angles, object_meshes, hit_distances, centroids, line_lengths)
+
+
+def plane_line_strings(all_contours_filtered, per_degree, centroids, line_lengths):
+    "Create the lines of every plane from its centroid with its line length, return a dictionary with a list of lines per plane"
+    return {plane: create_lines(per_degree, centroid, line_length)
+            for plane, centroid, line_length in zip(all_contours_filtered, centroids, line_lengths)}
+
+
+def line_intersections(all_contours_filtered, per_degree, method="vectorized"):
+    "Compute all intersection points per plane per line with all objects and the lines per plane"
     
-    #Create linestring objects
-    for i in range(len(x_start)):
-        lines.append(LineString([[x_start[i], y_start[i]], [x_end[i], y_end[i]]]))
+    #The Shapely implementation is kept as reference
+    if method == "shapely":
+        return line_intersections_shapely(all_contours_filtered, per_degree)
     
-    return lines
+    ray_directions = create_ray_directions(per_degree)
+    centroids, line_lengths = plane_lines(all_contours_filtered)
+    lines = plane_line_strings(all_contours_filtered, per_degree, centroids, line_lengths)
+    hit_distances = ray_intersection_distances(all_contours_filtered, per_degree, centroids, line_lengths)
     
+    return intersections_from_hit_distances(all_contours_filtered, hit_distances, ray_directions, centroids), lines
+
 
-def line_intersections(all_contours_filtered, per_degree):
-    "Compute all intersection points per plane per line with all objects"
+def line_intersections_adaptive(all_contours_filtered, per_degree, resolution, vessel_wall):
+    "Compute all intersection points per plane per line with all objects for lines every resolution degrees and the lines per plane"
+    ray_directions = create_ray_directions(resolution)
+    centroids, line_lengths = plane_lines(all_contours_filtered)
+    lines = plane_line_strings(all_contours_filtered, resolution, centroids, line_lengths)
+    hit_distances = adaptive_ray_intersection_distances(all_contours_filtered, per_degree, resolution, vessel_wall, centroids, line_lengths)
+    
+    return intersections_from_hit_distances(all_contours_filtered, hit_distances, ray_directions, centroids), lines
+
+
+def intersections_from_hit_distances(all_contours_filtered, hit_distances, ray_directions, centroids=None):
+    "Convert the (planes, lines, objects) hit distances from the centroids to the intersection points per plane per line per object mesh"
+    shapely = lazy_imports.shapely()
+    if centroids is None:
+        centroids = np.zeros((len(hit_distances), 2))
     
     #Initialize dictonary per plane
     all_intersections = {}
+    
+    for plane, plane_distances, centroid in zip(all_contours_filtered, hit_distances, centroids):
+        object_meshes = list(all_contours_filtered[plane])
+        
+        #Create the closest intersection point of every line with every object mesh at once
+        hit = plane_distances < np.inf
+        points = shapely.points(centroid + np.where(hit, plane_distances, 0)[:, :, np.newaxis] * ray_directions[:, np.newaxis, :])
+        
+        #Initialize dictionary per line, only the object meshes that are intersected are added
+        intersection_per_line = {}
+        for i in range(len(ray_directions)):
+            intersection_per_line[f'line{i}'] = {object_mesh: points[i, j] for j, object_mesh in enumerate(object_meshes)
+                                                 if hit[i, j]}
+            
+        #Add to main dictionary 
+        all_intersections[plane] = intersection_per_line
+        
+    return all_intersections
+
+
+def ray_contact(plane_distances, object_meshes, vessel_wall):
+    """Determine for every line of a plane if the tumor and a vessel are within vessel_wall of each other,
+    plane_distances are the hit distances with shape (lines, objects) and object_meshes the names of the columns"""
+    tumor = np.array(["tumor" in object_mesh for object_mesh in object_meshes])
+    
+    #The distance between two intersections on the same line is the difference of their hit distances
+    with np.errstate(invalid='ignore'):
+        gaps = np.abs(plane_distances[:, tumor].min(axis=1, keepdims=True) - plane_distances[:, ~tumor])
+    return np.any(gaps <= vessel_wall, axis=1)
+
 
-    for plane in all_contours_filtered:
+def adaptive_ray_intersection_distances(all_contours_filtered, per_degree, resolution, vessel_wall, centroids=None, line_lengths=None):
+    """Compute the hit distances of ray_intersection_distances for lines every resolution degrees, but only evaluate
+    the fine lines between two coarse lines (every per_degree) that differ in contact between the tumor and the vessel.
+    The other fine lines take the hit distances of the preceding coarse line, so contact regions narrower than
+    per_degree are not detected. per_degree has to be a multiple of resolution. centroids and line_lengths per plane
+    default to those of vessel_centroids.
+    Return an array with shape (planes, lines, objects) for the lines of create_lines(resolution)"""
+    ray_directions = create_ray_directions(resolution)
+    number_of_lines = len(ray_directions)
+    step = int(round(per_degree / resolution))
+    if step < 1 or not np.isclose(step * resolution, per_degree):
+        raise ValueError("per_degree has to be a multiple of resolution")
+    
+    #Every fine line refers to the coarse line preceding it
+    coarse_lines = np.arange(0, number_of_lines, step)
+    preceding_coarse_line = np.arange(number_of_lines) // step
+    
+    if centroids is None:
+        centroids, line_lengths = plane_lines(all_contours_filtered)
+    
+    hit_distances = []
+    for plane, centroid, line_length in zip(all_contours_filtered, centroids, line_lengths):
+        object_meshes = list(all_contours_filtered[plane])
+        segments = [contour_segments(contour) - centroid for contour in all_contours_filtered[plane].values()]
+        
+        #Evaluate the coarse lines
+        coarse_distances = np.stack([ray_segment_distances(ray_directions[coarse_lines], object_segments, line_length)
+                                     for object_segments in segments], axis=1)
+        plane_distances = coarse_distances[preceding_coarse_line]
         
-        #Compute lines for the vessel
-        lines = []
-        centroid_vessel = Point(0, 0) #Since the centroid is always in at 0,0 due to the defenition of the planes coordinate system
-        for object_mesh in all_contours_filtered[plane]:
-            if not 'tumor' in object_mesh:
-                lines = create_lines(per_degree)
+        #Find the coarse intervals with a transition in contact, the last interval wraps around to the first line
+        contact = ray_contact(coarse_distances, object_meshes, vessel_wall)
+        transitions = np.nonzero(contact != np.roll(contact, -1))[0]
+        refine = np.isin(preceding_coarse_line, transitions) & (np.arange(number_of_lines) % step != 0)
+        
+        #Evaluate only the fine lines within these intervals
+        if np.any(refine):
+            plane_distances[refine] = np.stack([ray_segment_distances(ray_directions[refine], object_segments, line_length)
+                                                for object_segments in segments], axis=1)
+        hit_distances.append(plane_distances)
+        
+    if not hit_distances:
+        return np.zeros((0, number_of_lines, 0))
+    return np.stack(hit_distances)
+
+
+def line_intersections_shapely(all_contours_filtered, per_degree):
+    "Compute all intersection points per plane per line with all objects using Shapely per line and the lines per plane"
+    
+    #Initialize dictonary per plane
+    all_intersections = {}
+    centroids, line_lengths = plane_lines(all_contours_filtered)
+    lines = plane_line_strings(all_contours_filtered, per_degree, centroids, line_lengths)
+
+    for plane, centroid in zip(all_contours_filtered, centroids):
+        centroid_vessel = lazy_imports.shapely().Point(centroid)
         
         #Initialize dictionary per line
         intersection_per_line = {}
         
         #Compute the intersection points for every line for every object mesh in every plane 
-        for i, line in enumerate(lines):
+        for i, line in enumerate(lines[plane]):
             
             #Initialize dictionary per object
             intersection_per_object_mesh = {}
@@ -0,0 +1,113 @@
+"""
+Mesh store
+==========
+
+Native on-disk format for the object meshes. A stored mesh is a directory with the vertices and faces as .npy files, the
+prebuilt face index (BoundingVolumeHierarchy) and optionally the face adjacency. The arrays are opened memory-mapped, so
+opening a mesh does not parse or copy anything and all worker processes share the same pages of the operating system.
+
+Convert an STL once:
+    python -m scripts.mesh_store models/case1_tumor.STL models/case1_tumor.mesh
+"""
+
+#Import packages
+import argparse
+import json
+import os
+
+import numpy as np
+
+#Import modules
+from scripts.spatial_index import BoundingVolumeHierarchy
+from scripts import lazy_imports
+
+
+#Increase when the stored layout changes
+STORE_VERSION = 1
+
+
+class StoredMesh:
+    """
+    Read-only mesh backed by memory-mapped arrays. It provides the vertices and faces used by the slicing and the prebuilt
+    face_index, use tolazy_imports.trimesh() for anything else (e.g. visualization).
+    """
+
+    def __init__(self, directory, mmap_mode="r"):
+        """ Open a mesh written by save_mesh"""
+        with open(os.path.join(directory, "mesh.json")) as file:
+            metadata = json.load(file)
+        if metadata.get("version") != STORE_VERSION:
+            raise ValueError(f"{directory} has mesh store version {metadata.get('version')}, expected {STORE_VERSION}")
+
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        self.directory = directory
+        self.vertices = load("vertices")
+        self.faces = load("faces")
+        self.face_adjacency = load("face_adjacency") if metadata["face_adjacency"] else None
+        self.face_index = BoundingVolumeHierarchy.from_arrays({name: load(f"face_index_{name}") for name in metadata["face_index"]})
+
+    @property
+    def bounds(self):
+        """ Axis aligned bounds of the vertices as [minimum, maximum]"""
+        return np.array([self.vertices.min(axis=0), self.vertices.max(axis=0)])
+
+    def to_trimesh(self):
+        """ Copy the mesh into a trimesh object without merging or reordering the vertices"""
+        return lazy_imports.trimesh().Trimesh(vertices=np.array(self.vertices), faces=np.array(self.faces), process=False)
+
+
+def save_mesh(mesh, directory, leaf_size=16, face_adjacency=False):
+    """ Write the vertices, faces and face index of a mesh (and optionally its face adjacency) to directory"""
+    os.makedirs(directory, exist_ok=True)
+
+    def save(name, array):
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+    save("vertices", np.asarray(mesh.vertices, dtype=np.float64))
+    save("faces", np.asarray(mesh.faces, dtype=np.int64))
+    if face_adjacency:
+        save("face_adjacency", np.asarray(mesh.face_adjacency, dtype=np.int64))
+
+    face_index = getattr(mesh, "face_index", None) or BoundingVolumeHierarchy.from_mesh(mesh, leaf_size)
+    face_index_arrays = face_index.to_arrays()
+    for name, array in face_index_arrays.items():
+        save(f"face_index_{name}", array)
+
+    #The metadata is written last, a directory without it is not a complete mesh
+    with open(os.path.join(directory, "mesh.json"), "w") as file:
+        json.dump({"version": STORE_VERSION, "face_adjacency": bool(face_adjacency), "face_index": list(face_index_arrays)}, file)
+
+
+def convert_mesh(mesh_path, directory, leaf_size=16, face_adjacency=False):
+    """ Load a mesh file (e.g. STL) with trimesh once and write it to the mesh store"""
+    save_mesh(lazy_imports.trimesh().load(mesh_path), directory, leaf_size, face_adjacency)
+    return StoredMesh(directory)
+
+
+def is_stored_mesh(path):
+    """ Check if path is a directory written by save_mesh"""
+    return os.path.isfile(os.path.join(path, "mesh.json"))
+
+
+def load_mesh(path):
+    """ Open a stored mesh memory-mapped, any other file is loaded with trimesh"""
+    if is_stored_mesh(path):
+        return StoredMesh(path)
+    return lazy_imports.trimesh().load(path)
+
+
+def main(arguments=None):
+    """Command line entry point to convert a mesh file to the mesh store"""
+    parser = argparse.ArgumentParser(description="Convert a mesh file to the memory-mapped mesh store")
+    parser.add_argument("mesh", help="Mesh file readable by trimesh, e.g. an STL")
+    parser.add_argument("directory", help="Output directory of the stored mesh")
+    parser.add_argument("--leaf-size", type=int, default=16, help="Maximum number of faces per leaf of the face index")
+    parser.add_argument("--face-adjacency", action="store_true", help="Store the face adjacency as well")
+    arguments = parser.parse_args(arguments)
+    convert_mesh(arguments.mesh, arguments.directory, arguments.leaf_size, arguments.face_adjacency)
+
+
+if __name__ == "__main__":
+    main()
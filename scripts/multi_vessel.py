@@ -0,0 +1,105 @@
+"""
+Multi-vessel mode
+=================
+
+Assess the contact of one tumor with several vessels (e.g. CA, SMA, CHA, SMV and PV) in one run. Every vessel has its
+own centerline and is processed as a tumor-vessel pair, the vessels are processed concurrently in threads. The face
+index of the tumor is built once and the tumor slices are shared between the vessels, a plane that coincides with a
+plane of another vessel (same origin and normal) reuses the tumor intersection.
+"""
+
+#Import packages
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+#Import modules
+from scripts.spatial_index import build_face_indices
+from scripts.plane_intersections import intersection_plane_with_straddling_faces, iter_intersection_planes_with_object, contact_candidate_planes, MERGE_TOLERANCE
+from scripts.pipeline import stream_intersections, stream_features
+from scripts.centerline import Centerline
+from scripts import profiling
+
+
+class TumorSlices:
+    """Intersections of the tumor meshes with planes, computed once per plane and shared between threads"""
+
+    def __init__(self, tumor_meshes, face_indices=None, decimals=9):
+        """tumor_meshes is a dictionary of the tumor meshes, planes are matched on origins and normals rounded to decimals"""
+        self.tumor_meshes = tumor_meshes
+        self.face_indices = face_indices if face_indices is not None else build_face_indices(tumor_meshes)
+        self.decimals = decimals
+        self.slices = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def intersect(self, plane_origin, plane_normal):
+        """Return a dictionary with the intersection points of the plane with every tumor mesh"""
+        key = np.round(np.concatenate([plane_origin, plane_normal]), self.decimals).tobytes()
+        with self.lock:
+            intersections = self.slices.get(key)
+            if intersections is not None:
+                self.hits += 1
+                return intersections
+
+        #Slice outside the lock, two threads may slice the same plane at the same time which gives the same result
+        intersections = {}
+        for tumor in self.tumor_meshes:
+            candidate_faces = self.face_indices[tumor].query_plane(plane_origin, plane_normal, tolerance=MERGE_TOLERANCE)
+            intersections[tumor] = intersection_plane_with_straddling_faces(self.tumor_meshes[tumor], plane_origin, plane_normal,
+                                                                            candidate_faces=candidate_faces)
+        with self.lock:
+            self.slices[key] = intersections
+        return intersections
+
+
+def iter_intersections_with_shared_tumor(tumor_slices, vessel, vessel_mesh, vessel_face_index, centerline_points, normal_points, plane_indices):
+    """Yield for every plane the key f"plane{i}" and a dictionary with the intersection points of the tumor meshes (from the
+    shared tumor slices) and of the vessel"""
+    vessel_intersections = iter_intersection_planes_with_object(vessel_mesh, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                face_index=vessel_face_index)
+    for plane_index, intersection in zip(plane_indices.tolist(), vessel_intersections):
+        profiling.count("planes")
+        intersections = dict(tumor_slices.intersect(centerline_points[plane_index], normal_points[plane_index]))
+        intersections[vessel] = intersection
+        yield f"plane{plane_index}", intersections
+
+
+def process_vessel(tumor_slices, vessel, vessel_mesh, centerline_points, normal_points, per_degree, vessel_wall, minimum_degrees,
+                   angular_resolution=None, vessel_face_index=None, reference_vectors=None, arc_lengths=None):
+    """Compute the features of one vessel with its own centerline, reference_vectors optionally gives the in-plane x axis
+    and arc_lengths the arc length of every plane.
+    Return the maximum contact length, its plane numbers and an EncasementAngles container"""
+    centerline_points = np.asarray(centerline_points, dtype=np.float64)
+    normal_points = np.asarray(normal_points, dtype=np.float64)
+    object_meshes = {**tumor_slices.tumor_meshes, vessel: vessel_mesh}
+    face_indices = dict(tumor_slices.face_indices)
+    face_indices[vessel] = vessel_face_index if vessel_face_index is not None else build_face_indices({vessel: vessel_mesh})[vessel]
+
+    #Only the planes that can contain contact with this vessel are sliced
+    with profiling.stage("candidate planes"):
+        plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, vessel_wall, face_indices)
+    intersections_with_planes = iter_intersections_with_shared_tumor(tumor_slices, vessel, vessel_mesh, face_indices[vessel],
+                                                                     centerline_points, normal_points, plane_indices)
+    all_distances_filtered = stream_intersections(intersections_with_planes, object_meshes, centerline_points, normal_points, per_degree,
+                                                  vessel_wall, angular_resolution, reference_vectors)
+
+    line_degree = per_degree if angular_resolution is None else angular_resolution
+    arc_lengths = Centerline(centerline_points).arc_lengths if arc_lengths is None else arc_lengths
+    return stream_features(all_distances_filtered, centerline_points, line_degree, minimum_degrees, arc_lengths)
+
+
+def process_vessels(tumor_meshes, vessel_meshes, centerlines, per_degree, vessel_wall, minimum_degrees, angular_resolution=None, workers=None):
+    """Compute the features of every vessel concurrently. centerlines holds per vessel a tuple (centerline points, normals),
+    optionally followed by the reference vectors and the arc lengths of the planes.
+    Return a dictionary with per vessel the maximum contact length, its plane numbers and an EncasementAngles container"""
+    tumor_slices = TumorSlices(tumor_meshes)
+
+    with ThreadPoolExecutor(max_workers=workers or len(vessel_meshes)) as executor:
+        futures = {}
+        for vessel in vessel_meshes:
+            centerline_points, normal_points, reference_vectors, arc_lengths = (tuple(centerlines[vessel]) + (None, None))[:4]
+            futures[vessel] = executor.submit(process_vessel, tumor_slices, vessel, vessel_meshes[vessel], centerline_points, normal_points,
+                                              per_degree, vessel_wall, minimum_degrees, angular_resolution, None, reference_vectors, arc_lengths)
+        return {vessel: future.result() for vessel, future in futures.items()}
@@ -0,0 +1,138 @@
+#Import packages
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+#Import modules
+from scripts.spatial_index import build_face_indices
+from scripts.plane_intersections import intersection_planes_with_objects
+from scripts.contour_creation import create_contour_from_intersection_points
+from scripts.line_intersections import filter_planes, line_angles, line_hit_distances
+from scripts.results import RayHits, DistanceMatrix
+from scripts.distances import calculate_distance
+from scripts.mesh_store import StoredMesh, save_mesh
+
+
+def process_planes(object_meshes, centerline_points, normal_points, plane_indices, per_degree,
+                   angular_resolution=None, vessel_wall=None, face_indices=None, reference_vectors=None):
+    """ Run slicing, contour creation, line intersections and distance calculation for the given plane numbers.
+    reference_vectors optionally gives the in-plane x axis of every plane.
+    Return the dictionary all_contours and the RayHits and DistanceMatrix of these planes, the lines of a plane follow from
+    the origin and line length in the RayHits"""
+    plane_indices = np.asarray(plane_indices, dtype=np.int64)
+    intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                 face_indices, plane_indices)
+    all_contours = create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                           reference_vectors)
+    all_contours_filtered = filter_planes(all_contours)
+
+    ray_hits = line_hit_distances(all_contours_filtered, per_degree, angular_resolution, vessel_wall)
+    all_distances = calculate_distance(ray_hits)
+
+    return all_contours, ray_hits, all_distances
+
+
+#Case loaded by this worker process, kept between tasks so the meshes are only read once per worker
+_worker_case = {}
+
+
+def _load_case(case_path):
+    """ Open the memory-mapped meshes, centerline and face indices of a case written by PlaneExecutor once per worker"""
+    if _worker_case.get("path") != case_path:
+        with open(os.path.join(case_path, "case.json")) as file:
+            object_names = json.load(file)["object_names"]
+        object_meshes = {name: StoredMesh(os.path.join(case_path, f"object{number}")) for number, name in enumerate(object_names)}
+        reference_path = os.path.join(case_path, "reference_vectors.npy")
+        _worker_case.clear()
+        _worker_case.update(path=case_path,
+                            object_meshes=object_meshes,
+                            centerline_points=np.load(os.path.join(case_path, "centerline_points.npy")),
+                            normal_points=np.load(os.path.join(case_path, "normal_points.npy")),
+                            reference_vectors=np.load(reference_path) if os.path.exists(reference_path) else None,
+                            face_indices=build_face_indices(object_meshes))
+    return _worker_case
+
+
+def _process_planes_task(case_path, plane_indices, per_degree, angular_resolution, vessel_wall):
+    """ Task executed by a worker process for a chunk of planes"""
+    case = _load_case(case_path)
+    return process_planes(case["object_meshes"], case["centerline_points"], case["normal_points"], plane_indices, per_degree,
+                          angular_resolution, vessel_wall, case["face_indices"], case["reference_vectors"])
+
+
+class PlaneExecutor:
+    """
+    Process pool that shards the planes of a case over worker processes. The meshes of a case are written once to a
+    temporary mesh store and opened memory-mapped once per worker, tasks only contain the plane numbers. The pool can be
+    reused for multiple cases and is closed with close() or by using it as a context manager.
+    """
+
+    def __init__(self, workers=None, chunk_size=8):
+        """ Initialization of the process pool, workers defaults to the number of CPUs"""
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.directory = tempfile.mkdtemp(prefix="tm2_3_")
+        self.number_of_cases = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """ Shut down the workers and remove the temporary case files"""
+        self.pool.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _write_case(self, object_meshes, centerline_points, normal_points, reference_vectors=None):
+        """ Write the meshes and centerline of a case to the mesh store, so the workers open them memory-mapped"""
+        self.number_of_cases += 1
+        case_path = os.path.join(self.directory, f"case{self.number_of_cases}")
+        os.makedirs(case_path)
+        for number, object_mesh in enumerate(object_meshes):
+            mesh = object_meshes[object_mesh]
+            if isinstance(mesh, StoredMesh):
+                #Already stored, link instead of copying the arrays
+                os.symlink(os.path.abspath(mesh.directory), os.path.join(case_path, f"object{number}"))
+            else:
+                save_mesh(mesh, os.path.join(case_path, f"object{number}"))
+        np.save(os.path.join(case_path, "centerline_points.npy"), np.asarray(centerline_points))
+        np.save(os.path.join(case_path, "normal_points.npy"), np.asarray(normal_points))
+        if reference_vectors is not None:
+            np.save(os.path.join(case_path, "reference_vectors.npy"), np.asarray(reference_vectors))
+        with open(os.path.join(case_path, "case.json"), "w") as file:
+            json.dump({"object_names": list(object_meshes)}, file)
+        return case_path
+
+    def run(self, object_meshes, centerline_points, normal_points, per_degree, angular_resolution=None, vessel_wall=None, plane_indices=None,
+            reference_vectors=None):
+        """ Process all planes of a case, or only the given plane numbers, in parallel.
+        Return all_contours, the RayHits and the DistanceMatrix, equal to running process_planes serially"""
+        case_path = self._write_case(object_meshes, centerline_points, normal_points, reference_vectors)
+
+        #Submit the planes in chunks of consecutive plane numbers
+        plane_numbers = np.arange(len(centerline_points)) if plane_indices is None else np.asarray(plane_indices, dtype=np.int64)
+        futures = [self.pool.submit(_process_planes_task, case_path, plane_numbers[start:start + self.chunk_size],
+                                    per_degree, angular_resolution, vessel_wall)
+                   for start in range(0, len(plane_numbers), self.chunk_size)]
+
+        #Merge the results in plane order
+        all_contours = {}
+        ray_hits_list, distance_matrices = [], []
+        for future in futures:
+            contours, ray_hits, distances = future.result()
+            all_contours.update(contours)
+            ray_hits_list.append(ray_hits)
+            distance_matrices.append(distances)
+
+        shutil.rmtree(case_path, ignore_errors=True)
+        line_degree = per_degree if angular_resolution is None else angular_resolution
+        angles = line_angles(line_degree)
+        return (all_contours, RayHits.concatenate(ray_hits_list, angles, list(object_meshes)),
+                DistanceMatrix.concatenate(distance_matrices, angles))
@@ -0,0 +1,106 @@
+"""
+Streaming pipeline
+==================
+
+Generator version of the per-plane stages. Every stage consumes and yields one plane at a time, as (plane, value)
+pairs for the intersections and contours and as single-plane RayHits/DistanceMatrix containers from the lines onwards.
+The peak memory is bounded by a single plane (and one chunk of vertex distances) regardless of number_of_slices.
+The stages call the same functions as the pipeline in main.py, so the results are identical.
+"""
+
+#Import packages
+import numpy as np
+
+#Import modules
+from scripts.plane_intersections import iter_intersection_planes_with_objects, contact_candidate_planes
+from scripts.contour_creation import create_contour_from_intersection_points
+from scripts.line_intersections import filter_planes, line_hit_distances
+from scripts.distances import calculate_distance, filter_distances
+from scripts.features import feature_angles, longest_consecutive_planes, contact_length
+from scripts.results import EncasementAngles
+from scripts import profiling
+
+
+def iter_contours(intersections_with_planes, object_meshes, centerline_points, normal_points, reference_vectors=None):
+    """Yield the contour per object mesh for every (plane, intersection points) pair"""
+    for plane, intersections in intersections_with_planes:
+        with profiling.stage("contours"):
+            all_contours = create_contour_from_intersection_points({plane: intersections}, object_meshes, centerline_points, normal_points,
+                                                                   reference_vectors)
+        yield from all_contours.items()
+
+
+def iter_filter_planes(all_contours):
+    """Yield only the (plane, contours) pairs in which the tumor is present"""
+    for plane, contours in all_contours:
+        with profiling.stage("filter planes"):
+            all_contours_filtered = filter_planes({plane: contours})
+        yield from all_contours_filtered.items()
+
+
+def iter_line_intersections(all_contours_filtered, per_degree, angular_resolution=None, vessel_wall=None):
+    """Yield a single-plane RayHits container with the hit distances per line per object mesh for every (plane, contours) pair"""
+    for plane, contours in all_contours_filtered:
+        with profiling.stage("line intersections"):
+            ray_hits = line_hit_distances({plane: contours}, per_degree, angular_resolution, vessel_wall)
+        yield ray_hits
+
+
+def iter_distances(all_ray_hits):
+    """Yield a single-plane DistanceMatrix with the distance per line between the tumor and the vessel for every RayHits"""
+    for ray_hits in all_ray_hits:
+        with profiling.stage("distances"):
+            distances = calculate_distance(ray_hits)
+        yield distances
+
+
+def iter_filter_distances(all_distances, vessel_wall):
+    """Yield only the planes with contact, with the distances of the lines without contact set to infinity"""
+    for distances in all_distances:
+        with profiling.stage("filter distances"):
+            distances_filtered = filter_distances(distances, vessel_wall)
+        if len(distances_filtered):
+            yield distances_filtered
+
+
+def stream_intersections(intersections_with_planes, object_meshes, centerline_points, normal_points, per_degree, vessel_wall,
+                         angular_resolution=None, reference_vectors=None):
+    """Chain contour creation, line intersections, distances and distance filtering as generators on a stream of
+    (plane, intersection points) pairs. Yield a single-plane DistanceMatrix for the planes with contact.
+    Every stage is measured per plane by scripts.profiling, the slicing as producing the next pair"""
+    intersections_with_planes = profiling.timed("slicing", intersections_with_planes)
+    all_contours = iter_contours(intersections_with_planes, object_meshes, centerline_points, normal_points, reference_vectors)
+    all_contours_filtered = iter_filter_planes(all_contours)
+    all_ray_hits = iter_line_intersections(all_contours_filtered, per_degree, angular_resolution, vessel_wall)
+    all_distances = iter_distances(all_ray_hits)
+    return iter_filter_distances(all_distances, vessel_wall)
+
+
+def stream_planes(object_meshes, centerline_points, normal_points, per_degree, vessel_wall, angular_resolution=None, face_indices=None,
+                  reference_vectors=None):
+    """Chain slicing, contour creation, line intersections, distances and distance filtering as generators.
+    Planes that cannot have contact (see contact_candidate_planes) are skipped before slicing.
+    Yield a single-plane DistanceMatrix for the planes with contact between the tumor and the vessel"""
+    with profiling.stage("candidate planes"):
+        plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, vessel_wall, face_indices)
+    intersections_with_planes = iter_intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                      face_indices, plane_indices)
+    return stream_intersections(intersections_with_planes, object_meshes, centerline_points, normal_points, per_degree, vessel_wall,
+                                angular_resolution, reference_vectors)
+
+
+def stream_features(all_distances_filtered, centerline_points, per_degree, minimum_degrees, arc_lengths=None):
+    """Compute the maximum contact length, its planes and the angles of encasement in a single pass over a stream of
+    DistanceMatrix containers. Only the plane numbers with contact and the angles are kept.
+    Return the maximum contact length, its plane numbers and an EncasementAngles container"""
+    plane_numbers = []
+    all_angles = []
+    for distances_filtered in all_distances_filtered:
+        with profiling.stage("angles"):
+            plane_numbers.extend(distances_filtered.plane_indices[np.isfinite(distances_filtered.distances).any(axis=1)].tolist())
+            all_angles.append(feature_angles(distances_filtered, per_degree, minimum_degrees))
+
+    with profiling.stage("contact length"):
+        plane_numbers_longest_streak = longest_consecutive_planes(plane_numbers)
+        maximum_contact_length = contact_length(plane_numbers_longest_streak, centerline_points, arc_lengths)
+    return maximum_contact_length, plane_numbers_longest_streak, EncasementAngles.concatenate(all_angles)
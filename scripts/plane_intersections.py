@@ -1,10 +1,20 @@
 #Import packages
-import trimesh
+import numpy as np
+
+#Import modules
+from scripts.spatial_index import BoundingVolumeHierarchy
+from scripts import lazy_imports, profiling
+
+
+#Distance below which a vertex counts as lying on a plane, equal to trimesh.tol.merge. trimesh itself is only imported
+#when a mesh is sliced (see _trimesh), so the candidate planes and cached runs do not pay for importing it
+MERGE_TOLERANCE = 1e-8
+
 
 def intersection_plane_with_object(object_mesh, plane_origin, plane_normal):
-    """ Create an intersection plane perpendicular on the plane_normal with plane_origin. 
+    """ Create an intersection plane perpendicular on the plane_normal with plane_origin.
     Return intersection points of this plane with the mesh-object"""
-    intersection = trimesh.intersections.mesh_plane(
+    intersection = lazy_imports.trimesh().intersections.mesh_plane(
         object_mesh,
         plane_origin=plane_origin,
         plane_normal=plane_normal,
@@ -14,24 +24,174 @@ def intersection_plane_with_object(object_mesh, plane_origin, plane_normal):
 
 
 def intersection_plane_with_objects(object_meshes, plane_origin, plane_normal):
-    """ Create an intersection plane perpendicular on the plane_normal with plane_origin. 
+    """ Create an intersection plane perpendicular on the plane_normal with plane_origin.
     Return intersection points of this plane with multiple mesh-objects"""
     intersections_points = {}
     for object_mesh in object_meshes:
         intersection = intersection_plane_with_object(object_meshes[object_mesh], plane_origin, plane_normal)
         intersections_points[f"{object_mesh}"] = intersection
-    
+
     return intersections_points
 
-def intersection_planes_with_objects(object_meshes, plane_origins, plane_normals):
-    """ Create an intersection plane perpendicular on the plane_normal with plane_origin. 
-    Return a dictionary with for every plane the intersection points of this plane with multiple mesh-objects
+
+def signed_distances_to_planes(vertices, plane_origins, plane_normals):
+    """ Compute the signed distance of every vertex to every plane in one vectorized pass.
+    Return an array with shape (planes, vertices)"""
+    vertices = np.asanyarray(vertices, dtype=np.float64)
+    plane_origins = np.asanyarray(plane_origins, dtype=np.float64).reshape(-1, 3)
+    plane_normals = np.asanyarray(plane_normals, dtype=np.float64).reshape(-1, 3)
+
+    #The distance to a plane is n.v - n.o, so all planes can be handled by a single matrix product
+    offsets = np.einsum('ij,ij->i', plane_origins, plane_normals)
+    return plane_normals @ vertices.T - offsets[:, np.newaxis]
+
+
+class StraddlingFaces:
+    """Minimal mesh holding only the faces cut by a plane, trimesh.intersections.mesh_plane only needs the vertices and faces"""
+    __slots__ = ("vertices", "faces")
+
+    def __init__(self, vertices, faces):
+        self.vertices = vertices
+        self.faces = faces
+
+
+def intersection_plane_with_straddling_faces(object_mesh, plane_origin, plane_normal, vertex_distances=None, candidate_faces=None):
+    """ Slice the mesh-object with a plane, only visiting the faces whose vertex distances straddle the plane.
+    Either provide the vertex_distances of all vertices or the sorted candidate_faces that may be cut by the plane.
+    Return the same intersection points as intersection_plane_with_object"""
+    vertices = object_mesh.vertices
+    faces = object_mesh.faces
+    if vertex_distances is None:
+        #Only compute the distances of the vertices of the candidate faces
+        used_vertices, local_faces = np.unique(faces[candidate_faces], return_inverse=True)
+        vertices = vertices[used_vertices]
+        faces = local_faces.reshape(-1, 3)
+        vertex_distances = signed_distances_to_planes(vertices, plane_origin, plane_normal)[0]
+
+    #A face can only be cut by the plane if one or two of its vertices lie above the plane
+    vertices_above = (vertex_distances > MERGE_TOLERANCE).view(np.int8)
+    number_above = vertices_above[faces].sum(axis=1, dtype=np.int8)
+    straddling_faces = np.nonzero((number_above == 1) | (number_above == 2))[0]
+    profiling.count("faces_tested", len(faces))
+    profiling.count("faces_cut", len(straddling_faces))
+
+    #No face is cut by the plane
+    if len(straddling_faces) == 0:
+        return np.zeros((0, 2, 3))
+
+    #Only hand the straddling faces and their vertices to trimesh, so the slicing itself does not scale with the mesh
+    used_vertices, local_faces = np.unique(faces[straddling_faces], return_inverse=True)
+    straddling_mesh = StraddlingFaces(vertices[used_vertices], local_faces.reshape(-1, 3))
+
+    intersection = lazy_imports.trimesh().intersections.mesh_plane(
+        straddling_mesh,
+        plane_origin=plane_origin,
+        plane_normal=plane_normal,
+        return_faces=False,
+        cached_dots=vertex_distances[used_vertices]
+    )
+    profiling.count("segments", len(intersection))
+    return intersection
+
+
+def iter_intersection_planes_with_object(object_mesh, plane_origins, plane_normals, chunk_size=32, face_index=None):
+    """ Intersect all planes with one mesh-object and yield the intersection points plane by plane. The vertex distances
+    are computed for a chunk of planes at once, the chunk_size limits the memory of the (planes, vertices) distance array.
+    If a face_index (BoundingVolumeHierarchy of the faces) is provided only the faces with bounds cut by a plane are tested"""
+    if face_index is not None:
+        for origin, normal in zip(plane_origins, plane_normals):
+            candidate_faces = face_index.query_plane(origin, normal, tolerance=MERGE_TOLERANCE)
+            yield intersection_plane_with_straddling_faces(object_mesh, origin, normal, candidate_faces=candidate_faces)
+        return
+
+    for start in range(0, len(plane_origins), chunk_size):
+        origins = plane_origins[start:start + chunk_size]
+        normals = plane_normals[start:start + chunk_size]
+
+        #Vertex distances for all planes in the chunk
+        distances = signed_distances_to_planes(object_mesh.vertices, origins, normals)
+
+        for origin, normal, vertex_distances in zip(origins, normals, distances):
+            yield intersection_plane_with_straddling_faces(object_mesh, origin, normal, vertex_distances)
+
+
+def intersection_planes_with_object(object_mesh, plane_origins, plane_normals, chunk_size=32, face_index=None):
+    """ Intersect all planes with one mesh-object, see iter_intersection_planes_with_object.
+    Return a list with the intersection points of every plane"""
+    return list(iter_intersection_planes_with_object(object_mesh, plane_origins, plane_normals, chunk_size, face_index))
+
+
+def iter_intersection_planes_with_objects(object_meshes, plane_origins, plane_normals, face_indices=None, plane_indices=None):
+    """ Yield for every plane the key f"plane{i}" and a dictionary with the intersection points of this plane with
+    multiple mesh-objects. Only one chunk of planes per object is kept in memory"""
+    if plane_indices is None:
+        plane_indices = range(len(plane_origins))
+
+    #One generator per object, advanced together plane by plane
+    generators = {}
+    for object_mesh in object_meshes:
+        face_index = None if face_indices is None else face_indices.get(object_mesh)
+        generators[object_mesh] = iter_intersection_planes_with_object(object_meshes[object_mesh], plane_origins, plane_normals, face_index=face_index)
+
+    for plane_index in plane_indices:
+        profiling.count("planes")
+        yield f"plane{plane_index}", {f"{object_mesh}": next(generators[object_mesh]) for object_mesh in object_meshes}
+
+
+def intersection_planes_with_objects(object_meshes, plane_origins, plane_normals, face_indices=None, plane_indices=None):
+    """ Create an intersection plane perpendicular on the plane_normal with plane_origin.
+    Return a dictionary with for every plane the intersection points of this plane with multiple mesh-objects.
+    face_indices is an optional dictionary with a BoundingVolumeHierarchy per object_mesh (see build_face_indices).
+    plane_indices optionally provides the plane numbers used in the keys when only a part of the planes is sliced
     """
-    intersection_points_per_object_per_plane = {}
-    i=0
-    for origin, normal in zip(plane_origins, plane_normals):
-        intersection = intersection_plane_with_objects(object_meshes, origin, normal)
-        intersection_points_per_object_per_plane[f"plane{i}"] = intersection
-        i+=1
-            
-    return intersection_points_per_object_per_plane
\ No newline at end of file
+    return dict(iter_intersection_planes_with_objects(object_meshes, plane_origins, plane_normals, face_indices, plane_indices))
+
+
+def contact_candidate_planes(object_meshes, plane_origins, plane_normals, vessel_wall=None, face_indices=None, chunk_size=32):
+    """ Return the numbers of the planes that can contain contact between the tumor and a vessel, without slicing.
+    A plane has to cut the tumor, i.e. the tumor vertices (and so its convex hull) lie on both sides of the plane. The
+    bounding box of the tumor is tested first as it is cheaper. If vessel_wall is given a plane also has to cut a face
+    of a vessel whose bounds overlap the tumor bounding box dilated by vessel_wall, found with the face index
+    (BoundingVolumeHierarchy) of the vessel. Planes that fail cannot have contact, so their slicing can be skipped.
+    The hull is tested for chunk_size planes at once, like iter_intersection_planes_with_object"""
+    plane_origins = np.asanyarray(plane_origins, dtype=np.float64)
+    plane_normals = np.asanyarray(plane_normals, dtype=np.float64)
+    tolerance = MERGE_TOLERANCE
+
+    tumor_vertices = np.vstack([np.asanyarray(object_meshes[object_mesh].vertices) for object_mesh in object_meshes if "tumor" in object_mesh])
+    tumor_lower = tumor_vertices.min(axis=0)
+    tumor_upper = tumor_vertices.max(axis=0)
+
+    #Bounding box test: the plane cuts the box if the box corners lie on both sides
+    corners = np.array(np.meshgrid(*zip(tumor_lower, tumor_upper), indexing="ij")).reshape(3, -1).T
+    corner_distances = signed_distances_to_planes(corners, plane_origins, plane_normals)
+    planes = np.nonzero((corner_distances.min(axis=1) <= tolerance) & (corner_distances.max(axis=1) >= -tolerance))[0]
+
+    #Hull test on the remaining planes, the extremes of a plane distance over the hull are attained at the vertices. The
+    #planes are tested per chunk to limit the memory of the (planes, vertices) distance array
+    cuts_hull = np.zeros(len(planes), dtype=bool)
+    for start in range(0, len(planes), chunk_size):
+        chunk = planes[start:start + chunk_size]
+        vertex_distances = signed_distances_to_planes(tumor_vertices, plane_origins[chunk], plane_normals[chunk])
+        cuts_hull[start:start + chunk_size] = (vertex_distances.min(axis=1) <= tolerance) & (vertex_distances.max(axis=1) >= -tolerance)
+    planes = planes[cuts_hull]
+
+    if vessel_wall is None:
+        return planes
+
+    #Dilated bound test: a vessel face cut by the plane has to lie within vessel_wall of the tumor bounding box
+    box_lower = tumor_lower - vessel_wall
+    box_upper = tumor_upper + vessel_wall
+    vessel_indices = []
+    for object_mesh in object_meshes:
+        if "tumor" in object_mesh:
+            continue
+        face_index = None if face_indices is None else face_indices.get(object_mesh)
+        if face_index is None:
+            face_index = getattr(object_meshes[object_mesh], "face_index", None) or BoundingVolumeHierarchy.from_mesh(object_meshes[object_mesh])
+        vessel_indices.append(face_index)
+
+    near_vessel = [any(len(face_index.query_plane_in_box(plane_origins[plane], plane_normals[plane], box_lower, box_upper, tolerance))
+                       for face_index in vessel_indices)
+                   for plane in planes.tolist()]
+    return planes[np.array(near_vessel, dtype=bool)]
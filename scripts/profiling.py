@@ -0,0 +1,195 @@
+"""
+Profiling
+=========
+
+Stage level instrumentation of a run. A stage is timed with
+
+    with profiling.stage("slicing"):
+        ...
+
+which adds its wall time, CPU time (of the whole process) and optionally the peak of the traced memory to the report.
+The kernels add counters such as the number of planes, faces tested, segments, rays and hits with profiling.count.
+Hooks are called with the name and the measurements of every finished stage, e.g. to send them to a monitoring system.
+
+Profiling is disabled by default: stage() then returns a shared no-op context manager and count() returns immediately,
+so the instrumentation costs one global lookup per call. Counters of worker processes (PlaneExecutor) are not collected,
+and the traced memory is only meaningful for stages that are not run concurrently in threads.
+"""
+
+#Import packages
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#Global switch, see enable and disable
+ENABLED = False
+
+_lock = threading.Lock()
+_stages = {}
+_counters = defaultdict(int)
+_hooks = []
+_stack = []
+_trace_memory = False
+
+
+class _NullStage:
+    """Context manager that does nothing, used for every stage while profiling is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+#Marks the end of an iterator in timed
+_END = object()
+
+
+class _Stage:
+    """Context manager that measures one execution of a stage"""
+    __slots__ = ("name", "wall_start", "cpu_start", "peak_memory")
+
+    def __init__(self, name):
+        self.name = name
+        self.peak_memory = 0
+
+    def __enter__(self):
+        if _trace_memory:
+            #The peak so far belongs to the enclosing stage, the peak is then measured from here
+            if _stack:
+                _stack[-1].peak_memory = max(_stack[-1].peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            _stack.append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = {"wall_seconds": time.perf_counter() - self.wall_start, "cpu_seconds": time.process_time() - self.cpu_start}
+        if _trace_memory:
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            if _stack and _stack[-1] is self:
+                _stack.pop()
+            if _stack:
+                _stack[-1].peak_memory = max(_stack[-1].peak_memory, self.peak_memory)
+            tracemalloc.reset_peak()
+            record["peak_memory_bytes"] = self.peak_memory
+
+        with _lock:
+            totals = _stages.setdefault(self.name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            totals["calls"] += 1
+            totals["wall_seconds"] += record["wall_seconds"]
+            totals["cpu_seconds"] += record["cpu_seconds"]
+            if "peak_memory_bytes" in record:
+                totals["peak_memory_bytes"] = max(totals.get("peak_memory_bytes", 0), record["peak_memory_bytes"])
+        for hook in list(_hooks):
+            hook(self.name, record)
+        return False
+
+
+def enable(trace_memory=False):
+    """Start collecting measurements, trace_memory also tracks the peak memory of every stage with tracemalloc
+    (which slows down the allocations)"""
+    global ENABLED, _trace_memory
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    ENABLED = True
+
+
+def disable():
+    """Stop collecting measurements, the measurements so far are kept until reset"""
+    global ENABLED, _trace_memory
+    ENABLED = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+    _stack.clear()
+
+
+def reset():
+    """Remove all measurements"""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def stage(name):
+    """Context manager that measures the stage name, a no-op while profiling is disabled"""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name, iterable):
+    """Yield the items of iterable, producing every item is measured as the stage name. Only use it on the source of a
+    chain of generators, for a generator that pulls from another one the time of the upstream stages would be included"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+
+def count(name, value=1):
+    """Add value to the counter name"""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] += int(value)
+
+
+def add_hook(hook):
+    """Call hook(name, record) after every stage, record holds wall_seconds, cpu_seconds and peak_memory_bytes if traced"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Stop calling hook"""
+    _hooks.remove(hook)
+
+
+def report():
+    """Return the measurements as a dictionary with the totals per stage, the counters, the counters per sliced plane and
+    the peak resident memory of the process"""
+    with _lock:
+        stages = {name: dict(totals) for name, totals in _stages.items()}
+        counters = dict(_counters)
+    planes = counters.get("planes", 0)
+    per_plane = {name: value / planes for name, value in counters.items() if name != "planes"} if planes else {}
+
+    peak_resident_bytes = None
+    if resource is not None:
+        #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_resident_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"stages": stages, "counters": counters, "per_plane": per_plane, "peak_resident_bytes": peak_resident_bytes}
+
+
+def format_report(profile=None):
+    """Format a report as a table with one line per stage followed by the counters"""
+    profile = report() if profile is None else profile
+    lines = [f'{"stage":<24}{"calls":>7}{"wall [s]":>11}{"cpu [s]":>11}{"peak [MB]":>11}']
+    for name, totals in profile["stages"].items():
+        peak = totals.get("peak_memory_bytes")
+        peak = f'{peak / 1024**2:>11.1f}' if peak is not None else f'{"-":>11}'
+        lines.append(f'{name:<24}{totals["calls"]:>7}{totals["wall_seconds"]:>11.4f}{totals["cpu_seconds"]:>11.4f}{peak}')
+    for name, value in profile["counters"].items():
+        per_plane = profile["per_plane"].get(name)
+        lines.append(f'{name:<24}{value:>7}' + (f'  ({per_plane:.1f} per plane)' if per_plane is not None else ''))
+    if profile["peak_resident_bytes"] is not None:
+        lines.append(f'{"peak resident memory":<24}{profile["peak_resident_bytes"] / 1024**2:>11.1f} MB')
+    return "\n".join(lines)
@@ -0,0 +1,150 @@
+#Import packages
+import numpy as np
+
+
+class RayHits:
+    """
+    Nearest intersection distances of every line with every object mesh for a set of planes.
+    hit_distances has shape (planes, lines, objects) and is np.inf where a line does not intersect an object mesh.
+    The lines of a plane start in its origin (the centroid of the vessel contour) and have length line_lengths.
+    """
+    __slots__ = ("plane_indices", "line_angles", "object_meshes", "hit_distances", "origins", "line_lengths")
+
+    def __init__(self, plane_indices, line_angles, object_meshes, hit_distances, origins=None, line_lengths=None):
+        self.plane_indices = np.asarray(plane_indices, dtype=np.int64)
+        self.line_angles = np.asarray(line_angles, dtype=np.float64)
+        self.object_meshes = list(object_meshes)
+        self.hit_distances = np.asarray(hit_distances, dtype=np.float64).reshape(len(self.plane_indices), len(self.line_angles), len(self.object_meshes))
+        self.origins = np.zeros((len(self.plane_indices), 2)) if origins is None else np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        self.line_lengths = np.full(len(self.plane_indices), np.inf) if line_lengths is None else np.asarray(line_lengths, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.plane_indices)
+
+    @staticmethod
+    def concatenate(ray_hits_list, line_angles, object_meshes):
+        """Stack the planes of multiple RayHits with the same lines and object meshes"""
+        ray_hits_list = [ray_hits for ray_hits in ray_hits_list if len(ray_hits)]
+        if not ray_hits_list:
+            return RayHits([], line_angles, object_meshes, np.zeros((0, len(line_angles), len(object_meshes))))
+        return RayHits(np.concatenate([ray_hits.plane_indices for ray_hits in ray_hits_list]), ray_hits_list[0].line_angles,
+                       ray_hits_list[0].object_meshes, np.concatenate([ray_hits.hit_distances for ray_hits in ray_hits_list]),
+                       np.concatenate([ray_hits.origins for ray_hits in ray_hits_list]),
+                       np.concatenate([ray_hits.line_lengths for ray_hits in ray_hits_list]))
+
+    def tumor_columns(self):
+        """Boolean mask of the object meshes that are a tumor"""
+        return np.array(["tumor" in object_mesh for object_mesh in self.object_meshes], dtype=bool)
+
+    def row(self, plane_index):
+        """Row of the plane with the given plane number"""
+        return np.nonzero(self.plane_indices == plane_index)[0][0]
+
+    def points(self, row):
+        """Return the 2D intersection points of plane row with shape (lines, objects, 2), np.nan where there is no intersection"""
+        theta = np.deg2rad(self.line_angles)
+        directions = np.column_stack([np.cos(theta), np.sin(theta)])
+        with np.errstate(invalid='ignore'):
+            points = self.origins[row] + self.hit_distances[row, :, :, np.newaxis] * directions[:, np.newaxis, :]
+        points[np.isinf(self.hit_distances[row])] = np.nan
+        return points
+
+
+class DistanceMatrix:
+    """
+    Distance between the tumor and the vessel per plane per line as a (planes, lines) float64 matrix, so the comparison
+    with vessel_wall gives the same contact as the dictionary pipeline.
+    np.inf marks a line without contact (no intersection with the tumor or, after filtering, too far from the vessel).
+    """
+    __slots__ = ("plane_indices", "line_angles", "distances")
+
+    def __init__(self, plane_indices, line_angles, distances):
+        self.plane_indices = np.asarray(plane_indices, dtype=np.int64)
+        self.line_angles = np.asarray(line_angles, dtype=np.float64)
+        self.distances = np.asarray(distances, dtype=np.float64).reshape(len(self.plane_indices), len(self.line_angles))
+
+    def __len__(self):
+        return len(self.plane_indices)
+
+    @staticmethod
+    def concatenate(distance_matrices, line_angles):
+        """Stack the planes of multiple DistanceMatrix containers with the same lines"""
+        return DistanceMatrix(np.concatenate([[]] + [matrix.plane_indices for matrix in distance_matrices]), line_angles,
+                              np.concatenate([np.zeros((0, len(line_angles)))] + [matrix.distances for matrix in distance_matrices]))
+
+    def select(self, rows):
+        """Return a DistanceMatrix with only the given rows (boolean mask or row numbers)"""
+        return DistanceMatrix(self.plane_indices[rows], self.line_angles, self.distances[rows])
+
+
+class EncasementAngles:
+    """
+    Angles of encasement, one entry per angle with the plane number, the angle in degrees and the first and last line
+    (row numbers of create_lines) between which the angle is created.
+    """
+    __slots__ = ("plane_indices", "angles", "first_lines", "last_lines")
+
+    def __init__(self, plane_indices, angles, first_lines, last_lines):
+        self.plane_indices = np.asarray(plane_indices, dtype=np.int64)
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.first_lines = np.asarray(first_lines, dtype=np.int64)
+        self.last_lines = np.asarray(last_lines, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.plane_indices)
+
+    def __iter__(self):
+        """Iterate over (plane number, angle, first line, last line)"""
+        return zip(self.plane_indices.tolist(), self.angles.tolist(), self.first_lines.tolist(), self.last_lines.tolist())
+
+    @staticmethod
+    def concatenate(encasement_angles_list):
+        """Stack the entries of multiple EncasementAngles containers"""
+        return EncasementAngles(*[np.concatenate([[]] + [getattr(angles, field) for angles in encasement_angles_list])
+                                  for field in EncasementAngles.__slots__])
+
+    def planes(self):
+        """Return the plane numbers that have at least one angle, in ascending order"""
+        return np.unique(self.plane_indices)
+
+    def for_plane(self, plane_index):
+        """Return the (angle, first line, last line) entries of a single plane"""
+        rows = self.plane_indices == plane_index
+        return list(zip(self.angles[rows].tolist(), self.first_lines[rows].tolist(), self.last_lines[rows].tolist()))
+
+
+class EncasementArcs:
+    """
+    Angles of encasement from the analytic engine, one entry per contact arc with the plane number, the angle in degrees
+    and the start and end direction of the arc in degrees (counterclockwise from the x axis of the plane, the end can
+    be smaller than the start if the arc crosses 0 degrees).
+    """
+    __slots__ = ("plane_indices", "angles", "start_angles", "end_angles")
+
+    def __init__(self, plane_indices, angles, start_angles, end_angles):
+        self.plane_indices = np.asarray(plane_indices, dtype=np.int64)
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.start_angles = np.asarray(start_angles, dtype=np.float64)
+        self.end_angles = np.asarray(end_angles, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.plane_indices)
+
+    def __iter__(self):
+        """Iterate over (plane number, angle, start angle, end angle)"""
+        return zip(self.plane_indices.tolist(), self.angles.tolist(), self.start_angles.tolist(), self.end_angles.tolist())
+
+    @staticmethod
+    def concatenate(encasement_arcs_list):
+        """Stack the entries of multiple EncasementArcs containers"""
+        return EncasementArcs(*[np.concatenate([[]] + [getattr(arcs, field) for arcs in encasement_arcs_list])
+                                for field in EncasementArcs.__slots__])
+
+    def planes(self):
+        """Return the plane numbers that have at least one angle, in ascending order"""
+        return np.unique(self.plane_indices)
+
+    def for_plane(self, plane_index):
+        """Return the (angle, start angle, end angle) entries of a single plane"""
+        rows = self.plane_indices == plane_index
+        return list(zip(self.angles[rows].tolist(), self.start_angles[rows].tolist(), self.end_angles[rows].tolist()))
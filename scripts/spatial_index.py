@@ -0,0 +1,146 @@
+#Import packages
+import numpy as np
+
+
+class BoundingVolumeHierarchy:
+    """
+    Axis aligned bounding box tree over primitives (the triangles of a mesh).
+    The tree is a complete binary tree stored level by level in arrays, the primitives of every leaf are a
+    contiguous range of self.order. Build it once per mesh and reuse it for every plane query.
+    """
+
+    def __init__(self, primitive_bounds, leaf_size=16):
+        """ Build the tree from the bounds of the primitives with shape (n, 2, dimensions) as [minimum, maximum]"""
+        primitive_bounds = np.asanyarray(primitive_bounds, dtype=np.float64)
+        self.primitive_lower = primitive_bounds[:, 0]
+        self.primitive_upper = primitive_bounds[:, 1]
+        number_of_primitives = len(primitive_bounds)
+
+        #Choose the depth such that every leaf holds at most leaf_size and at least one primitive
+        depth = 0
+        while number_of_primitives > leaf_size * 2**depth and 2**(depth + 1) <= number_of_primitives:
+            depth += 1
+        self.depth = depth
+
+        #Recursively split every range at the median of the primitive centers along the longest axis
+        centers = (self.primitive_lower + self.primitive_upper) / 2
+        order = np.arange(number_of_primitives)
+        ranges = [(0, number_of_primitives)]
+        for level in range(depth):
+            next_ranges = []
+            for start, end in ranges:
+                middle = (start + end) // 2
+                range_centers = centers[order[start:end]]
+                axis = np.argmax(np.ptp(range_centers, axis=0))
+                split = np.argpartition(range_centers[:, axis], middle - start)
+                order[start:end] = order[start:end][split]
+                next_ranges.extend([(start, middle), (middle, end)])
+            ranges = next_ranges
+        self.order = order
+        self.leaf_starts = np.array([start for start, end in ranges] + [number_of_primitives], dtype=np.int64)
+
+        #Bounds of the leaves, then merge pairs of children up to the root
+        if number_of_primitives == 0:
+            self.level_lower = []
+            self.level_upper = []
+            return
+        lower = np.minimum.reduceat(self.primitive_lower[order], self.leaf_starts[:-1], axis=0)
+        upper = np.maximum.reduceat(self.primitive_upper[order], self.leaf_starts[:-1], axis=0)
+        self.level_lower = [lower]
+        self.level_upper = [upper]
+        for level in range(depth):
+            lower = np.minimum(lower[0::2], lower[1::2])
+            upper = np.maximum(upper[0::2], upper[1::2])
+            self.level_lower.insert(0, lower)
+            self.level_upper.insert(0, upper)
+
+    @classmethod
+    def from_mesh(cls, mesh, leaf_size=16):
+        """ Build the tree over the faces of a trimesh object"""
+        triangles = np.asanyarray(mesh.vertices)[np.asanyarray(mesh.faces)]
+        return cls(np.stack([triangles.min(axis=1), triangles.max(axis=1)], axis=1), leaf_size)
+
+    def to_arrays(self):
+        """ Return the arrays of the tree as a dictionary, see from_arrays"""
+        arrays = {"primitive_lower": self.primitive_lower, "primitive_upper": self.primitive_upper,
+                  "order": self.order, "leaf_starts": self.leaf_starts}
+        for level in range(len(self.level_lower)):
+            arrays[f"level{level}_lower"] = self.level_lower[level]
+            arrays[f"level{level}_upper"] = self.level_upper[level]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """ Rebuild a tree from the arrays of to_arrays without repeating the build, the arrays may be memory-mapped"""
+        tree = cls.__new__(cls)
+        tree.primitive_lower = arrays["primitive_lower"]
+        tree.primitive_upper = arrays["primitive_upper"]
+        tree.order = arrays["order"]
+        tree.leaf_starts = arrays["leaf_starts"]
+        number_of_levels = sum(1 for name in arrays if name.endswith("_lower") and name.startswith("level"))
+        tree.level_lower = [arrays[f"level{level}_lower"] for level in range(number_of_levels)]
+        tree.level_upper = [arrays[f"level{level}_upper"] for level in range(number_of_levels)]
+        tree.depth = max(number_of_levels - 1, 0)
+        return tree
+
+    def _traverse(self, box_test):
+        """ Walk the tree level by level keeping the nodes for which box_test(lower, upper) is true.
+        Return the sorted indices of the primitives whose own bounds pass the test as well"""
+        if len(self.order) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(self.depth + 1):
+            nodes = nodes[box_test(self.level_lower[level][nodes], self.level_upper[level][nodes])]
+            if len(nodes) == 0:
+                return np.zeros(0, dtype=np.int64)
+            if level < self.depth:
+                nodes = np.stack([2 * nodes, 2 * nodes + 1], axis=1).ravel()
+
+        #Gather the primitives of the remaining leaves and test their own bounds
+        starts = self.leaf_starts[nodes]
+        counts = self.leaf_starts[nodes + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        candidates = self.order[np.arange(counts.sum()) + offsets]
+        candidates = candidates[box_test(self.primitive_lower[candidates], self.primitive_upper[candidates])]
+
+        #Ascending order keeps the primitives in the same order as an unindexed scan
+        return np.sort(candidates)
+
+    def query_plane(self, plane_origin, plane_normal, tolerance=0.0):
+        """ Return the indices of the primitives whose bounding box is cut by the plane"""
+        plane_origin = np.asanyarray(plane_origin, dtype=np.float64)
+        plane_normal = np.asanyarray(plane_normal, dtype=np.float64)
+
+        def box_test(lower, upper):
+            #A box is cut if the distance of its center to the plane is at most its projected half size
+            center_distance = ((lower + upper) / 2 - plane_origin) @ plane_normal
+            projected_radius = ((upper - lower) / 2) @ np.abs(plane_normal)
+            return np.abs(center_distance) <= projected_radius + tolerance
+
+        return self._traverse(box_test)
+
+    def query_plane_in_box(self, plane_origin, plane_normal, box_lower, box_upper, tolerance=0.0):
+        """ Return the indices of the primitives whose bounding box is cut by the plane and overlaps the box [box_lower, box_upper]"""
+        plane_origin = np.asanyarray(plane_origin, dtype=np.float64)
+        plane_normal = np.asanyarray(plane_normal, dtype=np.float64)
+
+        def box_test(lower, upper):
+            center_distance = ((lower + upper) / 2 - plane_origin) @ plane_normal
+            projected_radius = ((upper - lower) / 2) @ np.abs(plane_normal)
+            overlap = np.all((lower <= box_upper) & (upper >= box_lower), axis=1)
+            return overlap & (np.abs(center_distance) <= projected_radius + tolerance)
+
+        return self._traverse(box_test)
+
+
+def build_face_indices(object_meshes, leaf_size=16):
+    """ Build a bounding volume hierarchy over the faces of every mesh-object, return a dictionary per object_mesh"""
+    face_indices = {}
+    for object_mesh in object_meshes:
+        #Meshes from the mesh store may carry a prebuilt tree
+        face_index = getattr(object_meshes[object_mesh], "face_index", None)
+        if face_index is None:
+            face_index = BoundingVolumeHierarchy.from_mesh(object_meshes[object_mesh], leaf_size)
+        face_indices[object_mesh] = face_index
+    return face_indices
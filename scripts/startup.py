@@ -0,0 +1,85 @@
+"""
+Startup budget
+==============
+
+Import-time report of an entry point. The module is imported in a fresh interpreter with python -X importtime, the
+time spent in every package (summed over its modules) shows which dependencies are paid for at startup. trimesh,
+shapely and matplotlib are only imported by the stages that need them, so importing main or scripts.batch should not
+import any of them:
+
+    python -m scripts.startup main --budget 0.5
+
+exits with status 1 if the import takes longer than the budget in seconds or imports a heavy package.
+"""
+
+#Import packages
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+
+#Packages that are expensive to import and are only needed by some stages
+HEAVY_PACKAGES = ("trimesh", "shapely", "matplotlib", "mpl_toolkits", "pandas")
+
+_MARKER = "startup-import-marker"
+
+
+def import_profile(module):
+    """Import module in a fresh interpreter and return the wall time of the import in seconds and a dictionary with the
+    seconds spent in every top level package imported by it (self time of all its modules)"""
+    code = (f"import sys, time; sys.stderr.write('{_MARKER}\\n'); sys.stderr.flush(); start = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - start)")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+
+    #Lines after the marker look like "import time:   self [us] | cumulative | (indented) module name"
+    package_seconds = defaultdict(float)
+    lines = result.stderr.split(f"{_MARKER}\n", 1)[-1].splitlines()
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        package_seconds[name.strip().split(".")[0]] += int(self_time) / 1e6
+
+    import_seconds = float(result.stdout.strip().splitlines()[-1])
+    return import_seconds, dict(sorted(package_seconds.items(), key=lambda item: -item[1]))
+
+
+def format_import_profile(module, import_seconds, package_seconds, top=10):
+    """Format the import profile of module with the top packages"""
+    lines = [f'import {module}: {import_seconds:.3f} s']
+    for package, seconds in list(package_seconds.items())[:top]:
+        heavy = "  (heavy)" if package in HEAVY_PACKAGES else ""
+        lines.append(f'  {package:<24}{seconds:>8.3f} s{heavy}')
+    return "\n".join(lines)
+
+
+def budget_messages(module, import_seconds, package_seconds, budget_seconds):
+    """Return a message for every heavy package imported by module and if the import exceeds budget_seconds"""
+    messages = [f'import {module} imports {package}' for package in HEAVY_PACKAGES if package in package_seconds]
+    if import_seconds > budget_seconds:
+        messages.append(f'import {module} takes {import_seconds:.3f} s, the budget is {budget_seconds:.3f} s')
+    return messages
+
+
+def main(arguments=None):
+    """Command line entry point, exits with status 1 if a module is over budget"""
+    parser = argparse.ArgumentParser(description="Report the import time of entry points and check the startup budget")
+    parser.add_argument("modules", nargs="*", default=["main", "scripts.batch"], help="Modules to import")
+    parser.add_argument("--budget", type=float, default=0.5, help="Maximum import time in seconds")
+    arguments = parser.parse_args(arguments)
+
+    messages = []
+    for module in arguments.modules:
+        import_seconds, package_seconds = import_profile(module)
+        print(format_import_profile(module, import_seconds, package_seconds))
+        messages += budget_messages(module, import_seconds, package_seconds, arguments.budget)
+
+    for message in messages:
+        print(message)
+    if messages:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Parameter sweep
+===============
+
+Evaluate a grid of vessel_wall and minimum_degrees values from one geometry pass. Slicing, contour creation and the
+lines only depend on the meshes, the centerline and per_degree, so the distance between the tumor and the vessel along
+every line (the gap matrix) is computed once for the planes that can have contact with the largest vessel_wall. Every
+vessel_wall then only thresholds this matrix and every minimum_degrees only filters the angles, both vectorized over
+the grid. With the planes of Centerline.planes (as in main.py) the results equal running main.main() for every
+combination.
+"""
+
+#Import packages
+import numpy as np
+
+#Import modules
+from scripts.plane_intersections import iter_intersection_planes_with_objects, contact_candidate_planes
+from scripts.pipeline import iter_contours, iter_filter_planes, iter_line_intersections, iter_distances
+from scripts.line_intersections import line_angles
+from scripts.features import contact_runs
+from scripts.results import DistanceMatrix
+
+
+def gap_matrix(object_meshes, centerline_points, normal_points, per_degree, maximum_vessel_wall, face_indices=None, reference_vectors=None):
+    """Compute the unfiltered DistanceMatrix of the planes that can have contact within maximum_vessel_wall, streamed one
+    plane at a time so only the matrix itself is kept"""
+    plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, maximum_vessel_wall, face_indices)
+    intersections_with_planes = iter_intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                      face_indices, plane_indices)
+    all_contours_filtered = iter_filter_planes(iter_contours(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                             reference_vectors))
+    return DistanceMatrix.concatenate(list(iter_distances(iter_line_intersections(all_contours_filtered, per_degree))), line_angles(per_degree))
+
+
+def longest_streaks(plane_contact):
+    """First and last plane number of the longest range of consecutive planes with contact for every row of a
+    (rows, plane numbers) boolean mask, the first range wins if ranges are equally long. Rows without contact get -1"""
+    rows, first_planes, last_planes, lengths = contact_runs(plane_contact, circular=False)
+    first = np.full(len(plane_contact), -1)
+    last = np.full(len(plane_contact), -1)
+
+    #Sort the runs by row, longest first and then by first plane, the first run of every row is its longest streak
+    order = np.lexsort((first_planes, -lengths, rows))
+    longest = order[np.concatenate([[True], rows[order][1:] != rows[order][:-1]])] if len(order) else order
+    first[rows[longest]] = first_planes[longest]
+    last[rows[longest]] = last_planes[longest]
+    return first, last
+
+
+def sweep_thresholds(distances, vessel_walls, minimum_degrees_values, per_degree, centerline_points, arc_lengths=None):
+    """Evaluate every combination of vessel_walls and minimum_degrees_values on the gap matrix of gap_matrix.
+    The contact length is the arc length difference if arc_lengths is given, otherwise the sum of the chords between the
+    centerline points as in contact_length. Return a list with a row (dictionary) per combination"""
+    vessel_walls = np.asarray(vessel_walls, dtype=np.float64)
+    minimum_degrees_values = np.asarray(minimum_degrees_values, dtype=np.float64)
+    if arc_lengths is None:
+        arc_lengths = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(centerline_points, axis=0), axis=1))])
+
+    #Contact per vessel_wall per plane per line
+    contact = distances.distances[np.newaxis] <= vessel_walls[:, np.newaxis, np.newaxis]
+
+    #Longest range of consecutive planes with contact per vessel_wall
+    plane_contact = np.zeros((len(vessel_walls), len(centerline_points)), dtype=bool)
+    plane_contact[:, distances.plane_indices] = contact.any(axis=2)
+    first, last = longest_streaks(plane_contact)
+    contact_lengths = np.where(first >= 0, arc_lengths[last] - arc_lengths[np.maximum(first, 0)], 0)
+
+    #Angles of every run of lines with contact, counted per vessel_wall and minimum_degrees
+    rows, first_lines, last_lines, lengths = contact_runs(contact.reshape(-1, contact.shape[2]))
+    angles = np.round(lengths * per_degree, 6)
+    walls = rows // max(len(distances), 1)
+    kept = angles[:, np.newaxis] >= minimum_degrees_values[np.newaxis]
+    number_of_angles = np.zeros((len(vessel_walls), len(minimum_degrees_values)), dtype=np.int64)
+    np.add.at(number_of_angles, walls, kept)
+    maximum_angles = np.zeros(len(vessel_walls))
+    np.maximum.at(maximum_angles, walls, angles)
+
+    table = []
+    for i, vessel_wall in enumerate(vessel_walls.tolist()):
+        contact_planes = list(range(first[i], last[i] + 1)) if first[i] >= 0 else []
+        for j, minimum_degrees in enumerate(minimum_degrees_values.tolist()):
+            table.append({
+                "vessel_wall": vessel_wall,
+                "minimum_degrees": minimum_degrees,
+                "maximum_contact_length": float(contact_lengths[i]),
+                "contact_planes": contact_planes,
+                "maximum_angle": float(maximum_angles[i]) if maximum_angles[i] >= minimum_degrees else 0.0,
+                "number_of_angles": int(number_of_angles[i, j]),
+            })
+    return table
+
+
+def sweep(object_meshes, centerline_points, normal_points, per_degree, vessel_walls, minimum_degrees_values, arc_lengths=None,
+          face_indices=None, reference_vectors=None):
+    """Compute the gap matrix once and evaluate every combination of vessel_walls and minimum_degrees_values.
+    Return a list with per combination the maximum contact length, its planes, the largest angle of encasement of at
+    least minimum_degrees (0 if there is none) and the number of such angles"""
+    distances = gap_matrix(object_meshes, centerline_points, normal_points, per_degree, max(vessel_walls), face_indices, reference_vectors)
+    return sweep_thresholds(distances, vessel_walls, minimum_degrees_values, per_degree, centerline_points, arc_lengths)
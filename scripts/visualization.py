@@ -1,24 +1,118 @@
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+#Import packages
+import os
+
 import numpy as np
-import trimesh
+
+#Import modules
+from scripts import lazy_imports
+
+#matplotlib is only imported when the first figure is created, so runs without visualization do not pay for it
+_off_screen = False
+
+
+def use_off_screen():
+    """Render all figures with the Agg backend (no window), call before the first figure is created"""
+    global _off_screen
+    _off_screen = True
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def pyplot():
+    """Import matplotlib.pyplot on first use"""
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def show():
+    """Show all figures, with the off-screen renderer the figures are only closed"""
+    plt = pyplot()
+    if _off_screen:
+        plt.close("all")
+    else:
+        plt.show()
+
+
+def save_figure(fig, path, dpi=150):
+    """Write a figure to path, the format (e.g. .png or .svg) follows from the extension, and close it"""
+    plt = pyplot()
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+
+
+def show_figures(figures, figure_directory=None, figure_format="png"):
+    """Show the figures, or write every figure of the dictionary figures (name: plotter) to figure_directory as
+    name.figure_format"""
+    if figure_directory is None:
+        show()
+        return
+    for name, plotter in figures.items():
+        plotter.save(os.path.join(figure_directory, f'{name}.{figure_format}'))
+
+
+def decimate_mesh(vertices, faces, max_faces):
+    """Decimate a mesh by vertex clustering for a preview: vertices in the same cell of a regular grid are merged into
+    their mean, faces that collapse are removed. The cell size grows until at most max_faces faces remain.
+    Return the vertices and faces of the decimated mesh"""
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces)
+    if len(faces) <= max_faces:
+        return vertices, faces
+
+    #Start with cells of about the area per vertex, a closed mesh has about half as many vertices as faces
+    triangles = vertices[faces]
+    area = np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1).sum() / 2
+    cell_size = np.sqrt(area / (max_faces / 2))
+    lower = vertices.min(axis=0)
+
+    #Without area (degenerate faces) start from the bounding box, the loop ends at the latest when one cell holds all vertices
+    if not cell_size > 0:
+        cell_size = np.linalg.norm(vertices.max(axis=0) - lower) / np.sqrt(max_faces)
+    if not cell_size > 0:
+        return vertices[:1], faces[:0]
+
+    while True:
+        cells = np.floor((vertices - lower) / cell_size).astype(np.int64)
+        _, clusters = np.unique(cells, axis=0, return_inverse=True)
+        clusters = clusters.reshape(-1)
+        number_of_clusters = clusters.max() + 1
+        cluster_vertices = np.column_stack([np.bincount(clusters, vertices[:, axis], number_of_clusters) for axis in range(3)])
+        cluster_vertices /= np.bincount(clusters, minlength=number_of_clusters)[:, np.newaxis]
+
+        #Remove the faces with merged corners and the duplicate faces
+        cluster_faces = clusters[faces]
+        valid = ((cluster_faces[:, 0] != cluster_faces[:, 1]) & (cluster_faces[:, 1] != cluster_faces[:, 2])
+                 & (cluster_faces[:, 0] != cluster_faces[:, 2]))
+        cluster_faces = cluster_faces[valid]
+        _, unique_faces = np.unique(np.sort(cluster_faces, axis=1), axis=0, return_index=True)
+        cluster_faces = cluster_faces[np.sort(unique_faces)]
+        if len(cluster_faces) <= max_faces:
+            return cluster_vertices, cluster_faces
+        cell_size *= 1.5
+
 
 class ObjectPlotter:
     """
     A class to plot 3D mesh objects using matplotlib.
+    Meshes with more than max_faces faces are decimated (see decimate_mesh).
     """
     
-    def __init__(self):
+    def __init__(self, max_faces=None):
         """ Initialization of plotter """
-        self.fig = plt.figure() #Create figure
+        from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+        self.Poly3DCollection = Poly3DCollection
+        self.fig = pyplot().figure() #Create figure
         self.ax = self.fig.add_subplot(111, projection='3d') #Add 3D subplot
+        self.max_faces = max_faces
         
     def add_object(self, mesh, **kwargs):
         """ Add mesh object """
         #Add mesh-object to the plot
         vertices = mesh.vertices
         faces = mesh.faces
-        mesh_collection = Poly3DCollection(vertices[faces], **kwargs)
+        if self.max_faces is not None:
+            vertices, faces = decimate_mesh(vertices, faces, self.max_faces)
+        mesh_collection = self.Poly3DCollection(vertices[faces], **kwargs)
         self.ax.add_collection3d(mesh_collection)
         
     def add_points(self, points, **kwargs):
@@ -42,11 +136,18 @@ class ObjectPlotter:
         
         # Add legend
         self.ax.legend()
+
+    def save(self, path):
+        """Write the figure to path and close it"""
+        save_figure(self.fig, path)
     
 class ContourPlotter:
-    """Add contours to a 2D plot to visualize them"""
-    def __init__(self):
-        self.fig, self.ax = plt.subplots()
+    """Add contours to a 2D plot to visualize them, in a new figure or in the given axes of a figure"""
+    def __init__(self, ax=None):
+        if ax is None:
+            self.fig, self.ax = pyplot().subplots()
+        else:
+            self.fig, self.ax = ax.figure, ax
         self.contours = []
         
     def add_contour(self, contour, **kwargs):
@@ -57,6 +158,10 @@ class ContourPlotter:
     def add_point(self, point, **kwargs):
         """Add point to plot"""
         self.ax.plot(point.x, point.y, **kwargs)
+
+    def add_points(self, points, **kwargs):
+        """Add an array of 2D points with shape (n, 2) to plot, rows with np.nan are skipped"""
+        self.ax.plot(points[:, 0], points[:, 1], linestyle="none", **kwargs)
         
     def set_settings(self, title):
         """Set settings of the plot"""
@@ -72,6 +177,30 @@ class ContourPlotter:
 
         # Add legend
         self.ax.legend()
+
+    def save(self, path):
+        """Write the figure to path and close it"""
+        save_figure(self.fig, path)
+
+
+class PlaneGrid:
+    """One figure with a grid of 2D plots, e.g. one per plane with an angle of encasement, instead of a figure per plane"""
+    def __init__(self, number_of_plots, columns=4, size=4):
+        self.columns = max(1, min(columns, number_of_plots))
+        rows = max(1, -(-number_of_plots // self.columns))
+        self.fig, axes = pyplot().subplots(rows, self.columns, figsize=(size * self.columns, size * rows), squeeze=False)
+        self.axes = axes.reshape(-1)
+        for ax in self.axes[number_of_plots:]:
+            ax.set_visible(False)
+
+    def plotter(self, number):
+        """ContourPlotter that draws in plot number of the grid"""
+        return ContourPlotter(self.axes[number])
+
+    def save(self, path):
+        """Write the figure to path and close it"""
+        self.fig.tight_layout()
+        save_figure(self.fig, path)
     
         
 def create_plane_mesh(origin, normal, plane_size=2.0):
@@ -86,6 +215,8 @@ def create_plane_mesh(origin, normal, plane_size=2.0):
     Returns:
     - plane_mesh: A trimesh.Trimesh object representing the plane mesh.
     """
+    trimesh = lazy_imports.trimesh()
+    
     # Define the vertices of the plane in the local coordinate system (XY plane)
     half_size = plane_size / 2
     plane_vertices = np.array([
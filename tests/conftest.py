@@ -0,0 +1,74 @@
+#Import packages
+import os
+import sys
+
+import numpy as np
+import pytest
+
+#The tests import the scripts package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Import modules
+from scripts.benchmark import load_case
+from scripts.spatial_index import build_face_indices
+from scripts.plane_intersections import intersection_planes_with_objects, contact_candidate_planes
+from scripts.contour_creation import create_contour_from_intersection_points
+from scripts.line_intersections import filter_planes, line_hit_distances
+from scripts.distances import calculate_distance, filter_distances
+from scripts.features import feature_maximum_contact_length, feature_angles
+from scripts import lazy_imports
+
+
+NUMBER_OF_SLICES = 20
+PER_DEGREE = 1
+VESSEL_WALL = 1.5
+MINIMUM_DEGREES = 40
+
+
+@pytest.fixture(scope="session", params=[1, 2, 3], ids=["case1", "case2", "case3"])
+def mock_case(request):
+    """Meshes, face indices and planes of a mock case as in main.py"""
+    object_meshes, arc_lengths, centerline_points, normal_points, reference_vectors = load_case(request.param, NUMBER_OF_SLICES)
+    return {"object_meshes": object_meshes, "face_indices": build_face_indices(object_meshes), "arc_lengths": arc_lengths,
+            "centerline_points": centerline_points, "normal_points": normal_points, "reference_vectors": reference_vectors}
+
+
+def run_main(mock_case, vessel_wall=VESSEL_WALL, minimum_degrees=MINIMUM_DEGREES, per_degree=PER_DEGREE):
+    """Run the serial pipeline of main.py without visualization, return the results of every stage"""
+    object_meshes, face_indices = mock_case["object_meshes"], mock_case["face_indices"]
+    centerline_points, normal_points = mock_case["centerline_points"], mock_case["normal_points"]
+    plane_indices = contact_candidate_planes(object_meshes, centerline_points, normal_points, vessel_wall, face_indices)
+    intersections_with_planes = intersection_planes_with_objects(object_meshes, centerline_points[plane_indices], normal_points[plane_indices],
+                                                                 face_indices, plane_indices)
+    all_contours = create_contour_from_intersection_points(intersections_with_planes, object_meshes, centerline_points, normal_points,
+                                                           mock_case["reference_vectors"])
+    ray_hits = line_hit_distances(filter_planes(all_contours), per_degree)
+    all_distances = calculate_distance(ray_hits)
+    all_distances_filtered = filter_distances(all_distances, vessel_wall)
+    maximum_contact_length, plane_numbers = feature_maximum_contact_length(all_distances_filtered, centerline_points, mock_case["arc_lengths"])
+    all_angles = feature_angles(all_distances_filtered, per_degree, minimum_degrees)
+    return {"plane_indices": plane_indices, "intersections_with_planes": intersections_with_planes, "all_contours": all_contours,
+            "ray_hits": ray_hits, "all_distances": all_distances, "maximum_contact_length": maximum_contact_length,
+            "plane_numbers": plane_numbers, "all_angles": all_angles}
+
+
+def assert_same_contours(all_contours, expected_contours):
+    """Assert that two contour dictionaries have the same planes, object meshes and coordinates"""
+    shapely = lazy_imports.shapely()
+    assert list(all_contours) == list(expected_contours)
+    for plane in expected_contours:
+        assert list(all_contours[plane]) == list(expected_contours[plane])
+        for object_mesh in expected_contours[plane]:
+            assert shapely.equals_exact(all_contours[plane][object_mesh], expected_contours[plane][object_mesh], tolerance=0)
+
+
+def assert_same_angles(all_angles, expected_angles):
+    """Assert that two EncasementAngles containers hold the same entries"""
+    assert list(all_angles) == list(expected_angles)
+
+
+def assert_same_distances(distances, expected_distances):
+    """Assert that two DistanceMatrix containers hold the same planes, lines and distances"""
+    np.testing.assert_array_equal(distances.plane_indices, expected_distances.plane_indices)
+    np.testing.assert_array_equal(distances.line_angles, expected_distances.line_angles)
+    np.testing.assert_array_equal(distances.distances, expected_distances.distances)
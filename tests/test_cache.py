@@ -0,0 +1,42 @@
+#Import packages
+import os
+
+import numpy as np
+
+#Import modules
+from scripts.cache import SliceCache, cached_planes, cache_key
+from conftest import run_main, assert_same_contours
+
+
+def test_cache_round_trip(mock_case, tmp_path):
+    """A cached entry returns the same intersections and contours as slicing without the cache"""
+    expected = run_main(mock_case)
+    arguments = (mock_case["object_meshes"], mock_case["centerline_points"], mock_case["normal_points"], mock_case["face_indices"],
+                 expected["plane_indices"], mock_case["reference_vectors"])
+    cache = SliceCache(str(tmp_path))
+
+    #The first call slices and stores the entry, the second call reads it
+    for _ in range(2):
+        intersections_with_planes, all_contours = cached_planes(cache, *arguments)
+        assert len(os.listdir(tmp_path)) == 1
+        assert_same_contours(all_contours, expected["all_contours"])
+        assert list(intersections_with_planes) == list(expected["intersections_with_planes"])
+        for plane in expected["intersections_with_planes"]:
+            for object_mesh in expected["intersections_with_planes"][plane]:
+                np.testing.assert_array_equal(np.asarray(intersections_with_planes[plane][object_mesh]).reshape(-1, 2, 3),
+                                              np.asarray(expected["intersections_with_planes"][plane][object_mesh]).reshape(-1, 2, 3))
+
+
+def test_corrupt_entry_is_a_miss(mock_case, tmp_path):
+    """A truncated entry is removed and sliced again"""
+    expected = run_main(mock_case)
+    arguments = (mock_case["object_meshes"], mock_case["centerline_points"], mock_case["normal_points"], mock_case["face_indices"],
+                 expected["plane_indices"], mock_case["reference_vectors"])
+    cache = SliceCache(str(tmp_path))
+    key = cache_key(*arguments[:3], expected["plane_indices"], mock_case["reference_vectors"])
+    with open(cache.path(key), "wb") as file:
+        file.write(b"PK")
+
+    assert cache.get(key) is None
+    _, all_contours = cached_planes(cache, *arguments)
+    assert_same_contours(all_contours, expected["all_contours"])
@@ -0,0 +1,34 @@
+#Import packages
+import numpy as np
+
+#Import modules
+from scripts.parallel import PlaneExecutor, process_planes
+from conftest import PER_DEGREE, VESSEL_WALL, run_main, assert_same_contours, assert_same_distances
+
+
+def test_executor_equals_serial(mock_case):
+    """Sharding the planes over worker processes gives the same contours, hit distances and distances as one process"""
+    object_meshes = mock_case["object_meshes"]
+    centerline_points, normal_points = mock_case["centerline_points"], mock_case["normal_points"]
+    plane_indices = run_main(mock_case)["plane_indices"]
+
+    expected_contours, expected_ray_hits, expected_distances = process_planes(object_meshes, centerline_points, normal_points, plane_indices,
+                                                                             PER_DEGREE, None, VESSEL_WALL, mock_case["face_indices"],
+                                                                             mock_case["reference_vectors"])
+    with PlaneExecutor(workers=2, chunk_size=4) as executor:
+        all_contours, ray_hits, all_distances = executor.run(object_meshes, centerline_points, normal_points, PER_DEGREE, None, VESSEL_WALL,
+                                                             plane_indices, mock_case["reference_vectors"])
+
+    assert_same_contours(all_contours, expected_contours)
+    np.testing.assert_array_equal(ray_hits.plane_indices, expected_ray_hits.plane_indices)
+    np.testing.assert_array_equal(ray_hits.hit_distances, expected_ray_hits.hit_distances)
+    assert_same_distances(all_distances, expected_distances)
+
+
+def test_serial_process_planes_equals_main(mock_case):
+    """process_planes, the task of every worker, gives the same distances as the pipeline of main.py"""
+    expected = run_main(mock_case)
+    _, _, all_distances = process_planes(mock_case["object_meshes"], mock_case["centerline_points"], mock_case["normal_points"],
+                                         expected["plane_indices"], PER_DEGREE, None, VESSEL_WALL, mock_case["face_indices"],
+                                         mock_case["reference_vectors"])
+    assert_same_distances(all_distances, expected["all_distances"])
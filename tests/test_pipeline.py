@@ -0,0 +1,16 @@
+#Import modules
+from scripts.pipeline import stream_planes, stream_features
+from conftest import PER_DEGREE, VESSEL_WALL, MINIMUM_DEGREES, run_main, assert_same_angles
+
+
+def test_streaming_equals_main(mock_case):
+    """The generator pipeline gives the same contact length, contact planes and angles as main.py"""
+    expected = run_main(mock_case)
+    all_distances_filtered = stream_planes(mock_case["object_meshes"], mock_case["centerline_points"], mock_case["normal_points"], PER_DEGREE,
+                                           VESSEL_WALL, None, mock_case["face_indices"], mock_case["reference_vectors"])
+    maximum_contact_length, plane_numbers, all_angles = stream_features(all_distances_filtered, mock_case["centerline_points"], PER_DEGREE,
+                                                                        MINIMUM_DEGREES, mock_case["arc_lengths"])
+
+    assert maximum_contact_length == expected["maximum_contact_length"]
+    assert plane_numbers == expected["plane_numbers"]
+    assert_same_angles(all_angles, expected["all_angles"])
@@ -0,0 +1,25 @@
+#Import packages
+import pytest
+
+#Import modules
+from scripts.sweep import sweep
+from conftest import PER_DEGREE, run_main
+
+
+VESSEL_WALLS = [1.0, 1.5, 2.5]
+MINIMUM_DEGREES_VALUES = [20, 40]
+
+
+def test_sweep_equals_main(mock_case):
+    """Every combination of the sweep gives the features of main.py run with that vessel_wall and minimum_degrees"""
+    table = sweep(mock_case["object_meshes"], mock_case["centerline_points"], mock_case["normal_points"], PER_DEGREE, VESSEL_WALLS,
+                  MINIMUM_DEGREES_VALUES, mock_case["arc_lengths"], mock_case["face_indices"], mock_case["reference_vectors"])
+    assert len(table) == len(VESSEL_WALLS) * len(MINIMUM_DEGREES_VALUES)
+
+    for row in table:
+        expected = run_main(mock_case, row["vessel_wall"], row["minimum_degrees"])
+        angles = expected["all_angles"].angles
+        assert row["maximum_contact_length"] == pytest.approx(expected["maximum_contact_length"])
+        assert row["contact_planes"] == expected["plane_numbers"]
+        assert row["number_of_angles"] == len(angles)
+        assert row["maximum_angle"] == pytest.approx(angles.max() if len(angles) else 0.0)